@@ -0,0 +1,265 @@
+import argparse
+import collections
+import itertools
+import json
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import chess
+
+from chess_utils import console_logger, game_fens, iter_pgn_games
+from engine_pool import EnginePool, locate_engine, usable_cpus
+from profiling import add_profile_arguments, maybe_profile
+
+RENEW_GRACE_S = 10.0 # per position on top of movetime; a lease cannot be renewed past its positions' serial time plus this
+
+# Wire protocol: one JSON object per line in each direction, request/response.
+#   worker -> {"op": "lease", "worker": name, "max": n}          <- {"op": "batch", "lease": id, "movetime_ms": ms, "tasks": [{"id", "fen"}]}
+#                                                                 | {"op": "wait", "retry_s": s} | {"op": "done"}
+#   worker -> {"op": "renew", "lease": id}                       <- {"op": "ack", "ok": bool}
+#   worker -> {"op": "result", "lease": id, "results": [...]}    <- {"op": "ack", "accepted": n, "duplicates": n}
+
+def _send(stream, message: Dict[str, Any]) -> None:
+    stream.write((json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")); stream.flush()
+
+def _recv(stream) -> Optional[Dict[str, Any]]:
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+class Coordinator:
+    """
+    Hands out position batches under time-limited leases. A lease that is neither renewed nor
+    completed before `lease_timeout_s` expires and its unfinished positions go back to the queue.
+    Results are keyed by position id, so a late answer for re-dispatched work is counted as a duplicate
+    and dropped instead of overwriting the first result. A position leased `max_attempts` times without
+    a result (it crashes or hangs every engine) is recorded as failed so the run can still finish; renewals
+    stop being granted once a lease has had time to analyse its positions one after another, so a hung
+    engine cannot hold a lease forever.
+    """
+    def __init__(self, fens: List[str], movetime_ms: int = 500, lease_timeout_s: float = 30.0,
+                 results_path: Optional[str] = None, max_attempts: int = 3, logger: Callable[[str, str], None] = console_logger):
+        self.fens: List[str] = fens
+        self.movetime_ms: int = movetime_ms
+        self.lease_timeout_s: float = lease_timeout_s
+        self.max_attempts: int = max_attempts
+        self.logger: Callable[[str, str], None] = logger
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self.failed: Dict[int, int] = {} # task id -> attempts made
+        self._attempts: collections.Counter = collections.Counter()
+        self.duplicates = self.redispatched = 0
+        self._pending: Deque[int] = collections.deque(range(len(fens)))
+        self._leases: Dict[int, Tuple[List[int], float, str, float]] = {} # lease id -> (task ids, deadline, worker, renew limit)
+        self._lease_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.finished = threading.Event()
+        if not fens: self.finished.set()
+        self._results_file = open(results_path, "a", encoding="utf-8") if results_path else None
+
+    def _requeue(self, task_ids: List[int]) -> int:
+        # Called with the lock held: unanswered positions go back to the front, or fail after max_attempts.
+        retry = []
+        for task_id in task_ids:
+            if task_id in self.results or task_id in self.failed: continue
+            if self._attempts[task_id] < self.max_attempts: retry.append(task_id); continue
+            self.failed[task_id] = self._attempts[task_id]
+            self.logger(f"Position {task_id} failed {self._attempts[task_id]} times; giving up on it.", "user")
+            if self._results_file: self._results_file.write(json.dumps({"id": task_id, "fen": self.fens[task_id], "failed": True,
+                                                                        "attempts": self._attempts[task_id]}) + "\n")
+        self._pending.extendleft(reversed(retry)); self.redispatched += len(retry)
+        self._check_finished()
+        return len(retry)
+
+    def _check_finished(self) -> None:
+        # Called with the lock held; a position counts once whether it has a result, failed, or both.
+        if len(self.results.keys() | self.failed.keys()) == len(self.fens): self.finished.set()
+
+    def _expire_leases(self) -> None:
+        now = time.time()
+        for lease_id, (task_ids, deadline, worker, _limit) in list(self._leases.items()):
+            if deadline >= now: continue
+            del self._leases[lease_id]
+            requeued = self._requeue(task_ids)
+            self.logger(f"Lease {lease_id} from {worker} expired; re-queued {requeued} positions.", "user")
+
+    def lease(self, worker: str, max_tasks: int) -> Dict[str, Any]:
+        with self._lock:
+            self._expire_leases()
+            if self.finished.is_set(): return {"op": "done"}
+            task_ids = []
+            while self._pending and len(task_ids) < max_tasks:
+                task_id = self._pending.popleft()
+                if task_id not in self.results and task_id not in self.failed: task_ids.append(task_id); self._attempts[task_id] += 1
+            if not task_ids: return {"op": "wait", "retry_s": min(1.0, self.lease_timeout_s / 4)}
+            lease_id, now = next(self._lease_ids), time.time()
+            renew_limit = now + self.lease_timeout_s + len(task_ids) * (self.movetime_ms / 1000 + RENEW_GRACE_S)
+            self._leases[lease_id] = (task_ids, now + self.lease_timeout_s, worker, renew_limit)
+        return {"op": "batch", "lease": lease_id, "movetime_ms": self.movetime_ms,
+                "tasks": [{"id": t, "fen": self.fens[t]} for t in task_ids]}
+
+    def renew(self, lease_id: int) -> Dict[str, Any]:
+        with self._lock:
+            if lease_id not in self._leases: return {"op": "ack", "ok": False}
+            task_ids, _deadline, worker, renew_limit = self._leases[lease_id]
+            if time.time() >= renew_limit: return {"op": "ack", "ok": False} # left to expire at its current deadline
+            self._leases[lease_id] = (task_ids, min(time.time() + self.lease_timeout_s, renew_limit), worker, renew_limit)
+        return {"op": "ack", "ok": True}
+
+    def submit(self, lease_id: int, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        accepted = duplicates = 0
+        with self._lock:
+            for res in results:
+                task_id = res["id"]
+                if task_id in self.results: duplicates += 1; continue
+                self.failed.pop(task_id, None) # a late answer for a position given up on still counts
+                self.results[task_id] = res; accepted += 1
+                if self._results_file: self._results_file.write(json.dumps({**res, "fen": self.fens[task_id]}) + "\n")
+            self.duplicates += duplicates
+            lease = self._leases.pop(lease_id, None)
+            if lease: self._requeue(lease[0]) # positions the worker leased but did not answer go straight back
+            if self._results_file: self._results_file.flush()
+            self._check_finished()
+        return {"op": "ack", "accepted": accepted, "duplicates": duplicates}
+
+    def handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        op = message.get("op")
+        if op == "lease": return self.lease(message.get("worker", "?"), int(message.get("max", 1)))
+        if op == "renew": return self.renew(message["lease"])
+        if op == "result": return self.submit(message["lease"], message["results"])
+        return {"op": "error", "error": f"unknown op {op!r}"}
+
+    def serve(self, host: str = "127.0.0.1", port: int = 5555) -> "socketserver.ThreadingTCPServer":
+        """Starts the TCP server on a background thread and returns it (server.server_address has the bound port)."""
+        coordinator = self
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while (message := _recv(self.rfile)) is not None: _send(self.wfile, coordinator.handle(message))
+        server = socketserver.ThreadingTCPServer((host, port), _Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.logger(f"Coordinator listening on {server.server_address[0]}:{server.server_address[1]} with {len(self.fens)} positions.", "user")
+        return server
+
+    def close(self) -> None:
+        if self._results_file: self._results_file.close()
+
+class Worker:
+    """
+    Leases batches from a coordinator and analyses them on a local EnginePool, renewing the lease
+    while the batch runs (until the coordinator refuses). Reconnects with backoff if the coordinator goes away.
+    """
+    def __init__(self, host: str, port: int, pool: EnginePool, name: Optional[str] = None,
+                 logger: Callable[[str, str], None] = console_logger):
+        self.address: Tuple[str, int] = (host, port)
+        self.pool: EnginePool = pool
+        self.name: str = name or f"{socket.gethostname()}-{id(self) & 0xFFFF:04x}"
+        self.logger: Callable[[str, str], None] = logger
+        self.stop_event = threading.Event()
+        self._io_lock = threading.Lock() # renew and result share one connection
+
+    def _request(self, stream, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._io_lock:
+            _send(stream, message); return _recv(stream)
+
+    def _analyse_batch(self, stream, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        done = threading.Event()
+        def _renew_loop():
+            try:
+                while not done.wait(5.0):
+                    reply = self._request(stream, {"op": "renew", "lease": batch["lease"]})
+                    if not reply or not reply.get("ok"):
+                        self.logger(f"{self.name}: lease {batch['lease']} can no longer be renewed.", "debug"); return
+            except Exception as e: # the batch goes on; the lease may expire and be re-dispatched
+                self.logger(f"{self.name}: renewing lease {batch['lease']} failed ({e}).", "user")
+        renewer = threading.Thread(target=_renew_loop, daemon=True); renewer.start()
+        try:
+            outputs = self.pool.map(lambda engine, task: (task, engine.analyse(task["fen"], movetime_ms=batch["movetime_ms"])), batch["tasks"])
+        finally:
+            done.set(); renewer.join()
+        return [{"id": task["id"], "bestmove": res["bestmove"], "score": res["score"], "mate": res["mate"],
+                 "depth": res["depth"], "nodes": res["nodes"], "worker": self.name}
+                for task, res in outputs if res is not None] # failed positions are simply not returned; the coordinator re-queues them
+
+    def run(self) -> int:
+        analysed, backoff = 0, 0.5
+        while not self.stop_event.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=60) as sock, sock.makefile("rwb") as stream:
+                    backoff = 0.5
+                    while not self.stop_event.is_set():
+                        reply = self._request(stream, {"op": "lease", "worker": self.name, "max": self.pool.size * 2})
+                        if reply is None: raise ConnectionError("coordinator closed the connection")
+                        if reply["op"] == "done": self.logger(f"{self.name}: all work done ({analysed} positions).", "user"); return analysed
+                        if reply["op"] == "wait": time.sleep(reply["retry_s"]); continue
+                        results = self._analyse_batch(stream, reply)
+                        ack = self._request(stream, {"op": "result", "lease": reply["lease"], "results": results})
+                        analysed += len(results)
+                        self.logger(f"{self.name}: batch {reply['lease']} -> {ack}", "debug")
+            except (OSError, ConnectionError, json.JSONDecodeError) as e:
+                self.logger(f"{self.name}: connection problem ({e}); retrying in {backoff:.1f}s.", "user")
+                self.stop_event.wait(backoff); backoff = min(backoff * 2, 30.0)
+        return analysed
+
+def load_positions(path: str) -> List[str]:
+    """FENs from a PGN (every position of every game) or a FEN/EPD file (one per line)."""
+    if path.lower().endswith(".pgn"):
+        return [fen for game in iter_pgn_games(path) for fen in game_fens(game)[0][:-1]]
+    fens = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"): fens.append(chess.Board.from_epd(line.strip())[0].fen())
+    return fens
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribute position analysis over several machines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_coord = sub.add_parser("coordinator"); p_coord.add_argument("positions", help="PGN, FEN or EPD file")
+    p_coord.add_argument("--host", default="127.0.0.1"); p_coord.add_argument("--port", type=int, default=5555)
+    p_coord.add_argument("--movetime", type=int, default=500); p_coord.add_argument("--lease-timeout", type=float, default=30.0)
+    p_coord.add_argument("--max-attempts", type=int, default=3, help="Leases per position before it is recorded as failed")
+    p_coord.add_argument("--out", default="cluster_results.jsonl")
+    p_worker = sub.add_parser("worker"); p_worker.add_argument("--host", default="127.0.0.1"); p_worker.add_argument("--port", type=int, default=5555)
+    p_worker.add_argument("--engine", default=None); p_worker.add_argument("--workers", type=int, default=None)
+    add_profile_arguments(p_worker)
+    p_local = sub.add_parser("local", help="Coordinator plus N workers on localhost, for testing")
+    p_local.add_argument("positions"); p_local.add_argument("--nodes", type=int, default=3)
+    p_local.add_argument("--engine", default=None); p_local.add_argument("--workers", type=int, default=1, help="Engines per worker node")
+    p_local.add_argument("--movetime", type=int, default=200); p_local.add_argument("--lease-timeout", type=float, default=10.0)
+    p_local.add_argument("--max-attempts", type=int, default=3)
+    p_local.add_argument("--out", default=None)
+    add_profile_arguments(p_local)
+    args = parser.parse_args()
+
+    if args.command == "coordinator":
+        coord = Coordinator(load_positions(args.positions), args.movetime, args.lease_timeout, args.out, args.max_attempts)
+        srv = coord.serve(args.host, args.port)
+        while not coord.finished.wait(10): console_logger(f"{len(coord.results)}/{len(coord.fens)} positions done.", "user")
+        time.sleep(2) # let workers collect their 'done'
+        srv.shutdown(); coord.close()
+        console_logger(f"Finished: {len(coord.results)} results, {len(coord.failed)} failed, {coord.duplicates} duplicates dropped, {coord.redispatched} re-dispatched.", "user")
+    else:
+        engine_path = args.engine or locate_engine()
+        if not engine_path: parser.error("Engine not found; pass --engine.")
+        if args.command == "worker":
+            with maybe_profile(args, "cluster_worker"), EnginePool(engine_path, console_logger, size=args.workers) as engine_pool:
+                Worker(args.host, args.port, engine_pool).run()
+        else:
+            coord = Coordinator(load_positions(args.positions), args.movetime, args.lease_timeout, args.out, args.max_attempts)
+            srv = coord.serve("127.0.0.1", 0)
+            host, port = srv.server_address[:2]
+            with maybe_profile(args, "cluster_local"):
+                cpus = usable_cpus(); share = len(cpus) // args.nodes # disjoint slices, so pinned nodes do not stack on the first cores
+                pools = [EnginePool(engine_path, console_logger, size=args.workers, cpus=cpus[i * share:(i + 1) * share])
+                         for i in range(args.nodes)]
+                threads = [threading.Thread(target=Worker(host, port, pool, name=f"node{i}").run, daemon=True) for i, pool in enumerate(pools)]
+                start = time.time()
+                for t in threads: t.start()
+                coord.finished.wait()
+                for t in threads: t.join(timeout=5)
+                srv.shutdown(); coord.close()
+                for pool in pools: pool.close()
+            per_worker = collections.Counter(r["worker"] for r in coord.results.values())
+            console_logger(f"{len(coord.results)}/{len(coord.fens)} positions in {time.time() - start:.1f}s across {dict(per_worker)}; "
+                           f"{len(coord.failed)} failed, {coord.duplicates} duplicates, {coord.redispatched} re-dispatched.", "user")
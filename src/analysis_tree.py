@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import chess
+import chess.pgn
+import chess.polyglot
+import numpy as np
+
+from chess_utils import console_logger, iter_pgn_games
+from engine_communication import ChessEngineCommunicator
+from game_store import decode_move, encode_move
+
+# Nodes and edges are sorted by key so a reopened tree is looked up by binary search on the mmap, without building dicts.
+NODE_DTYPE = np.dtype([("key", "<u8"), ("depth", "<u2"), ("seldepth", "<u2"), ("score", "<i4"), ("mate", "u1"),
+                       ("bestmove", "<u2"), ("nodes", "<u8"), ("pv_start", "<u8"), ("pv_len", "<u2")])
+EDGE_DTYPE = np.dtype([("parent", "<u8"), ("move", "<u2"), ("child", "<u8")])
+MANIFEST_NAME = "tree.json"
+NO_MOVE = 0 # a1a1 never occurs as a real move
+
+class AnalysisTree:
+    """
+    Engine results for a study session as a DAG keyed by Zobrist hash: one node per position (the
+    deepest result seen for it) and one edge per move played between positions. A position reached
+    by another move order is the same node, so its analysis is reused instead of searched again.
+    New results live in dicts on top of the last saved generation until save() merges them.
+    """
+    def __init__(self, tree_dir: Optional[str] = None, logger: Callable[[str, str], None] = console_logger):
+        self.tree_dir: Optional[str] = tree_dir
+        self.logger: Callable[[str, str], None] = logger
+        self.manifest: Dict[str, Any] = {"generation": 0, "roots": [], "nodes": 0, "edges": 0, "pv": 0}
+        self._nodes = np.zeros(0, dtype=NODE_DTYPE)
+        self._edges = np.zeros(0, dtype=EDGE_DTYPE)
+        self._pv = np.zeros(0, dtype="<u2")
+        self._new_nodes: Dict[int, Dict[str, Any]] = {}
+        self._new_edges: Dict[int, Dict[int, int]] = {} # parent key -> {move code: child key}
+        self.hits = self.misses = 0
+        self._lock = threading.RLock() # writers (put/add_move/save) may run on prefetch threads
+        if tree_dir and os.path.exists(os.path.join(tree_dir, MANIFEST_NAME)): self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.tree_dir, f"{name}-{self.manifest['generation']:06d}.npy")
+
+    def _load(self) -> None:
+        with open(os.path.join(self.tree_dir, MANIFEST_NAME), encoding="utf-8") as f: self.manifest = json.load(f)
+        if self.manifest["nodes"]: self._nodes = np.load(self._path("nodes"), mmap_mode="r")
+        if self.manifest["edges"]: self._edges = np.load(self._path("edges"), mmap_mode="r")
+        if self.manifest["pv"]: self._pv = np.load(self._path("pv"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        saved = self._nodes["key"]
+        return len(saved) + sum(1 for key in self._new_nodes if not self._saved_index(saved, key)[1])
+
+    @staticmethod
+    def _saved_index(keys: np.ndarray, key: int) -> Tuple[int, bool]:
+        i = int(np.searchsorted(keys, np.uint64(key)))
+        return i, i < len(keys) and int(keys[i]) == key
+
+    def _node(self, key: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._new_nodes: return self._new_nodes[key]
+            i, found = self._saved_index(self._nodes["key"], key)
+            if not found: return None
+            row = self._nodes[i]
+            pv = self._pv[int(row["pv_start"]):int(row["pv_start"]) + int(row["pv_len"])]
+        return {"key": key, "depth": int(row["depth"]), "seldepth": int(row["seldepth"]), "score": int(row["score"]),
+                "mate": bool(row["mate"]), "bestmove": decode_move(int(row["bestmove"])).uci() if row["bestmove"] != NO_MOVE else None,
+                "nodes": int(row["nodes"]), "pv": [decode_move(int(code)).uci() for code in pv]}
+
+    def get(self, board: chess.Board, min_depth: int = 0) -> Optional[Dict[str, Any]]:
+        """The stored result for this position if it was searched to at least min_depth, else None."""
+        node = self._node(chess.polyglot.zobrist_hash(board))
+        return node if node is not None and node["depth"] >= min_depth else None
+
+    def put(self, board: chess.Board, result: Dict[str, Any]) -> bool:
+        """Stores an analyse()-style result unless the position already has one at least as deep. Returns True if stored."""
+        if result.get("score") is None: return False
+        key = chess.polyglot.zobrist_hash(board)
+        with self._lock:
+            existing = self._node(key)
+            if existing is not None and existing["depth"] >= result.get("depth", 0): return False
+            self._new_nodes[key] = {"key": key, "depth": result.get("depth", 0), "seldepth": result.get("seldepth", 0),
+                                    "score": result["score"], "mate": bool(result.get("mate")), "bestmove": result.get("bestmove"),
+                                    "nodes": result.get("nodes", 0), "pv": list(result.get("pv", []))}
+        return True
+
+    def add_move(self, board: chess.Board, move: chess.Move) -> int:
+        """Records the edge board --move--> child and returns the child's key."""
+        parent = chess.polyglot.zobrist_hash(board)
+        if not board.move_stack and board.fen() not in self.manifest["roots"]: self.manifest["roots"].append(board.fen())
+        board.push(move)
+        try: child = chess.polyglot.zobrist_hash(board)
+        finally: board.pop()
+        with self._lock: self._new_edges.setdefault(parent, {})[encode_move(move)] = child
+        return child
+
+    def children(self, board: chess.Board) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Moves recorded from this position (over every move order that reached it) with their child's result, if any."""
+        parent = chess.polyglot.zobrist_hash(board)
+        edges: Dict[int, int] = {}
+        parents = self._edges["parent"]
+        lo = int(np.searchsorted(parents, np.uint64(parent), side="left"))
+        hi = int(np.searchsorted(parents, np.uint64(parent), side="right"))
+        for row in self._edges[lo:hi]: edges[int(row["move"])] = int(row["child"])
+        edges.update(self._new_edges.get(parent, {}))
+        return {decode_move(code).uci(): self._node(child) for code, child in edges.items()}
+
+    def analyse(self, engine: ChessEngineCommunicator, board: chess.Board, depth: int,
+                movetime_ms: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Result for `board` to at least `depth`: from the tree if any move order already got there,
+        otherwise from the engine (without 'ucinewgame', so the engine's own hash is kept too).
+        Returned dicts carry 'cached' to tell the two apart.
+        """
+        if (node := self.get(board, depth)) is not None:
+            self.hits += 1; return {**node, "cached": True}
+        self.misses += 1
+        result = engine.analyse(board.fen(), movetime_ms=movetime_ms, depth=depth, new_game=False)
+        if result is None: return None
+        self.put(board, result)
+        return {**result, "cached": False}
+
+    def save(self, tree_dir: Optional[str] = None) -> None:
+        """Merges new results into the next generation of sorted arrays; the manifest is replaced last."""
+        with self._lock: self._save(tree_dir)
+
+    def _save(self, tree_dir: Optional[str]) -> None:
+        self.tree_dir = tree_dir or self.tree_dir
+        if not self.tree_dir: raise ValueError("AnalysisTree.save needs a directory.")
+        os.makedirs(self.tree_dir, exist_ok=True)
+        old_generation = self.manifest["generation"] if self._nodes.size or self._edges.size else None
+        saved_keys = self._nodes["key"]
+        keep = ~np.isin(saved_keys, np.fromiter(self._new_nodes, dtype=np.uint64, count=len(self._new_nodes)))
+        kept = np.array(self._nodes[keep])
+        pv_chunks: List[np.ndarray] = [self._pv[int(start):int(start) + int(n)] for start, n in zip(kept["pv_start"], kept["pv_len"])]
+        kept["pv_start"] = np.concatenate([[0], np.cumsum(kept["pv_len"], dtype=np.uint64)[:-1]]) if len(kept) else 0
+        pv_len = int(kept["pv_len"].sum())
+        added = np.zeros(len(self._new_nodes), dtype=NODE_DTYPE)
+        for i, node in enumerate(self._new_nodes.values()):
+            codes = np.array([encode_move(chess.Move.from_uci(m)) for m in node["pv"]], dtype="<u2")
+            best = encode_move(chess.Move.from_uci(node["bestmove"])) if node["bestmove"] not in (None, "(none)") else NO_MOVE
+            added[i] = (node["key"], node["depth"], node["seldepth"], node["score"], node["mate"], best, node["nodes"], pv_len, len(codes))
+            pv_chunks.append(codes); pv_len += len(codes)
+        nodes = np.concatenate([kept, added])
+        nodes = nodes[np.argsort(nodes["key"], kind="stable")]
+        new_edges = np.array([(p, m, c) for p, moves in self._new_edges.items() for m, c in moves.items()], dtype=EDGE_DTYPE)
+        edges = np.concatenate([self._edges, new_edges])
+        edges = edges[np.lexsort((edges["move"], edges["parent"]))]
+        if len(edges): # a move re-recorded after a reload duplicates its edge; keep one
+            edges = edges[np.concatenate([[True], (edges["parent"][1:] != edges["parent"][:-1]) | (edges["move"][1:] != edges["move"][:-1])])]
+        pv = np.concatenate(pv_chunks) if pv_chunks else np.zeros(0, dtype="<u2")
+
+        self.manifest["generation"] += 1
+        np.save(self._path("nodes"), nodes); np.save(self._path("edges"), edges); np.save(self._path("pv"), pv.astype("<u2"))
+        self.manifest.update({"nodes": len(nodes), "edges": len(edges), "pv": len(pv), "saved": time.time()})
+        tmp_path = os.path.join(self.tree_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f: json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.tree_dir, MANIFEST_NAME))
+
+        self._nodes, self._edges, self._pv = nodes, edges, pv
+        self._new_nodes.clear(); self._new_edges.clear()
+        if old_generation is not None:
+            for name in ("nodes", "edges", "pv"):
+                try: os.remove(os.path.join(self.tree_dir, f"{name}-{old_generation:06d}.npy"))
+                except OSError: pass # still mapped elsewhere (Windows); removed on a later save
+
+def iter_variation_boards(game: chess.pgn.Game) -> Iterator[Tuple[chess.Board, List[chess.Move]]]:
+    """Every position of a PGN game including all sidelines, depth-first, with the moves played from it."""
+    stack = [game]
+    while stack:
+        node = stack.pop()
+        yield node.board(), [child.move for child in node.variations]
+        stack.extend(reversed(node.variations))
+
+def analyse_study(tree: AnalysisTree, engine: ChessEngineCommunicator, pgn_path: str, depth: int,
+                  logger: Callable[[str, str], None] = console_logger) -> Dict[str, Any]:
+    """Analyses every position of every variation in a study PGN to `depth`, reusing the tree across transpositions."""
+    start = time.time()
+    seen = 0
+    for game in iter_pgn_games(pgn_path):
+        for board, moves in iter_variation_boards(game):
+            for move in moves: tree.add_move(board, move)
+            if board.is_game_over(): continue
+            seen += 1
+            tree.analyse(engine, board, depth)
+    summary = {"positions": seen, "searched": tree.misses, "reused": tree.hits, "elapsed_s": time.time() - start}
+    logger(f"{seen} positions: {tree.misses} searched, {tree.hits} reused from the tree, {summary['elapsed_s']:.1f}s.", "user")
+    return summary
+
+if __name__ == "__main__":
+    from engine_pool import locate_engine
+    from infinite_analysis import format_score, pv_to_san
+    parser = argparse.ArgumentParser(description="Transposition-aware analysis tree for study sessions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_study = sub.add_parser("study", help="Analyse every variation of a PGN into the tree")
+    p_study.add_argument("tree_dir"); p_study.add_argument("pgn")
+    p_study.add_argument("--depth", type=int, default=18); p_study.add_argument("--engine", default=None)
+    p_show = sub.add_parser("show", help="Stored result and recorded moves for a position")
+    p_show.add_argument("tree_dir"); p_show.add_argument("fen", nargs="?", default=chess.STARTING_FEN)
+    p_info = sub.add_parser("info"); p_info.add_argument("tree_dir")
+    args = parser.parse_args()
+
+    open_start = time.perf_counter()
+    tree = AnalysisTree(args.tree_dir)
+    open_ms = (time.perf_counter() - open_start) * 1000
+    if args.command == "study":
+        engine_path = args.engine or locate_engine()
+        if not engine_path: parser.error("Engine not found; pass --engine.")
+        engine = ChessEngineCommunicator(engine_path, console_logger)
+        try: analyse_study(tree, engine, args.pgn, args.depth)
+        finally: engine.stop_engine(); tree.save()
+    elif args.command == "show":
+        board = chess.Board(args.fen)
+        node = tree.get(board)
+        if node: console_logger(f"depth {node['depth']} {format_score(node['score'], node['mate'])} pv {' '.join(pv_to_san(board, node['pv']))}", "user")
+        else: console_logger("Position not in the tree.", "user")
+        for uci, child in tree.children(board).items(): # child scores are from the opponent's side; negate for this side
+            console_logger(f"  {board.san(chess.Move.from_uci(uci)):<8} " + (f"depth {child['depth']} {format_score(-child['score'], child['mate'])}" if child else "-"), "user")
+    else:
+        console_logger(f"{tree.manifest['nodes']} positions, {tree.manifest['edges']} moves, {len(tree.manifest['roots'])} roots, "
+                       f"generation {tree.manifest['generation']}; opened in {open_ms:.1f} ms.", "user")
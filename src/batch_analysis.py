@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from chess_utils import console_logger, iter_pgn_games_with_offsets
+from engine_pool import EnginePool, locate_engine
+from profiling import add_profile_arguments, maybe_profile
+
+JOURNAL_NAME = "journal.jsonl"
+_DONE = object() # queue sentinel
+
+class Journal:
+    """
+    Append-only JSON-lines log of a batch job. Every finished position, failed position and finished
+    game is one line, so the journal alone is enough to resume: JobState rebuilds what is already done.
+    Lines are fsync'ed at most every `sync_interval_s`; a crash loses at most that much work, never consistency.
+    """
+    def __init__(self, job_dir: str, sync_interval_s: float = 1.0):
+        os.makedirs(job_dir, exist_ok=True)
+        self.path: str = os.path.join(job_dir, JOURNAL_NAME)
+        self.sync_interval_s: float = sync_interval_s
+        self._lock = threading.Lock()
+        self._last_sync = time.time()
+        self._truncate_torn_tail()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _truncate_torn_tail(self) -> None:
+        # A crash mid-write leaves a partial last line; appending to it would glue the next record onto it.
+        if not os.path.exists(self.path): return
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END); pos = end
+            while pos > 0:
+                step = min(pos, 1 << 16); pos -= step
+                f.seek(pos); newline = f.read(step).rfind(b"\n")
+                if newline >= 0: pos += newline + 1; break
+            if pos < end: f.truncate(pos)
+
+    @staticmethod
+    def read(job_dir: str) -> List[Dict[str, Any]]:
+        path = os.path.join(job_dir, JOURNAL_NAME)
+        records = []
+        if not os.path.exists(path): return records
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: records.append(json.loads(line))
+                except json.JSONDecodeError: continue # torn line from a crash; later records are still valid
+        return records
+
+    def write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            if time.time() - self._last_sync >= self.sync_interval_s: self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush(); os.fsync(self._file.fileno()); self._last_sync = time.time()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed: self._sync(); self._file.close()
+
+class JobState:
+    """What the journal says is finished: whole games, single positions, and where to resume each file."""
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.header: Optional[Dict[str, Any]] = None
+        self.done_games: Set[Tuple[int, int]] = set()
+        self.done_positions: Set[Tuple[int, int, int]] = set()
+        self.game_ends: Dict[Tuple[int, int], int] = {}
+        self.results = self.failures = 0
+        for rec in records:
+            kind = rec.get("t")
+            if kind == "job": self.header = rec
+            elif kind in ("r", "fail"):
+                self.done_positions.add((rec["f"], rec["g"], rec["p"]))
+                if kind == "r": self.results += 1
+                else: self.failures += 1
+            elif kind == "g":
+                self.done_games.add((rec["f"], rec["g"])); self.game_ends[(rec["f"], rec["g"])] = rec["end"]
+
+    def resume_point(self, file_idx: int) -> Tuple[int, int]:
+        """(first game index not known to be finished, byte offset to start reading at) for a file."""
+        game_idx, offset = 0, 0
+        while (file_idx, game_idx) in self.done_games:
+            offset = self.game_ends[(file_idx, game_idx)]; game_idx += 1
+        return game_idx, offset
+
+class BatchAnalysisJob:
+    """
+    Analyses every position of every game in a list of PGN files with an EnginePool, journaling as it goes.
+    Running the same job directory again continues where the previous run stopped.
+    A position whose search fails gets its engine restarted and is re-queued behind the other work,
+    up to max_attempts, so one bad position or crashed engine never blocks the rest of the pool.
+    """
+    def __init__(self, job_dir: str, pgn_paths: Optional[List[str]], pool: EnginePool, movetime_ms: int = 500,
+                 max_attempts: int = 3, logger: Callable[[str, str], None] = console_logger):
+        self.job_dir: str = job_dir
+        self.pool: EnginePool = pool
+        self.max_attempts: int = max_attempts
+        self.logger: Callable[[str, str], None] = logger
+        self.state = JobState(Journal.read(job_dir))
+        if self.state.header:
+            if pgn_paths and [os.path.abspath(p) for p in pgn_paths] != self.state.header["files"]:
+                raise ValueError(f"{job_dir} already holds a job over different files; use a new job directory.")
+            self.files: List[str] = self.state.header["files"]
+            self.movetime_ms: int = self.state.header["movetime_ms"]
+            logger(f"Resuming job: {len(self.state.done_games)} games / {self.state.results} positions already done.", "user")
+        else:
+            if not pgn_paths: raise ValueError("A new job needs PGN files.")
+            self.files = [os.path.abspath(p) for p in pgn_paths]
+            self.movetime_ms = movetime_ms
+        self.journal = Journal(job_dir)
+        if not self.state.header: self.journal.write({"t": "job", "files": self.files, "movetime_ms": self.movetime_ms})
+        self._tasks: "queue.Queue" = queue.Queue()
+        self._slots = threading.Semaphore(pool.size * 8) # bounds queued positions; retries re-enter the queue without taking a slot
+        self._pending: Dict[Tuple[int, int], int] = {} # (file, game) -> positions still outstanding
+        self._game_ends: Dict[Tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._all_queued = threading.Event()
+        self._finished = threading.Event()
+        self._producer_error: Optional[BaseException] = None
+        self.completed = self.failed = 0
+
+    def _produce(self) -> None:
+        try: self._queue_games()
+        except BaseException as e: # e.g. an unreadable PGN: run() re-raises it instead of waiting forever
+            self._producer_error = e; self._finished.set()
+
+    def _queue_games(self) -> None:
+        for file_idx, path in enumerate(self.files):
+            game_idx, offset = self.state.resume_point(file_idx)
+            for _start, end, game in iter_pgn_games_with_offsets(path, offset):
+                key = (file_idx, game_idx)
+                if key not in self.state.done_games:
+                    board = game.board()
+                    fens = [board.fen()]
+                    for move in game.mainline_moves(): board.push(move); fens.append(board.fen())
+                    todo = [(ply, fen) for ply, fen in enumerate(fens[:-1]) if (file_idx, game_idx, ply) not in self.state.done_positions]
+                    with self._lock: self._game_ends[key] = end
+                    if not todo: self._finish_game(key)
+                    else:
+                        with self._lock: self._pending[key] = len(todo); self._outstanding += len(todo)
+                        for ply, fen in todo: self._slots.acquire(); self._tasks.put((file_idx, game_idx, ply, fen, 1))
+                game_idx += 1
+        self._all_queued.set()
+        with self._lock:
+            if self._outstanding == 0: self._finished.set()
+
+    def _finish_game(self, key: Tuple[int, int]) -> None:
+        with self._lock: end = self._game_ends.pop(key)
+        self.journal.write({"t": "g", "f": key[0], "g": key[1], "end": end})
+
+    def _position_done(self, key: Tuple[int, int]) -> None:
+        with self._lock:
+            self._pending[key] -= 1; self._outstanding -= 1
+            game_done = self._pending[key] == 0
+            if game_done: del self._pending[key]
+            all_done = self._all_queued.is_set() and self._outstanding == 0
+        if game_done: self._finish_game(key)
+        if all_done: self._finished.set()
+
+    def _worker(self) -> None:
+        while True:
+            task = self._tasks.get()
+            if task is _DONE: return
+            file_idx, game_idx, ply, fen, attempt = task
+            with self.pool.engine() as engine:
+                res = engine.analyse(fen, movetime_ms=self.movetime_ms)
+                if res is None: engine.restart_engine()
+            if res is None and attempt < self.max_attempts:
+                self.logger(f"Position {file_idx}/{game_idx}/{ply} failed (attempt {attempt}); re-queued on a fresh engine.", "debug")
+                self._tasks.put((file_idx, game_idx, ply, fen, attempt + 1))
+                continue
+            if res is None:
+                self.journal.write({"t": "fail", "f": file_idx, "g": game_idx, "p": ply, "fen": fen, "attempts": attempt})
+                self.failed += 1
+            else:
+                self.journal.write({"t": "r", "f": file_idx, "g": game_idx, "p": ply, "fen": fen, "bestmove": res["bestmove"],
+                                    "score": res["score"], "mate": res["mate"], "depth": res["depth"], "nodes": res["nodes"],
+                                    "ms": int(res["elapsed"] * 1000)})
+                self.completed += 1
+            self._slots.release()
+            self._position_done((file_idx, game_idx))
+
+    def run(self, progress_interval_s: float = 10.0) -> Dict[str, Any]:
+        start = time.time()
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.pool.size)]
+        for w in workers: w.start()
+        producer = threading.Thread(target=self._produce, daemon=True); producer.start()
+        try:
+            while not self._finished.wait(progress_interval_s):
+                rate = self.completed / max(time.time() - start, 1e-9)
+                self.logger(f"{self.completed} positions analysed ({rate:.1f}/s), {self.failed} failed, {self._outstanding} queued.", "user")
+        finally:
+            for _ in workers: self._tasks.put(_DONE)
+            for w in workers: w.join(timeout=self.movetime_ms / 1000.0 + 15)
+            self.journal.close()
+        if self._producer_error is not None: raise self._producer_error
+        summary = {"completed": self.completed, "failed": self.failed, "elapsed_s": time.time() - start}
+        self.logger(f"Job finished: {summary['completed']} positions this run, {summary['failed']} failed, {summary['elapsed_s']:.1f}s.", "user")
+        return summary
+
+def export_dataset(job_dir: str, dataset_dir: str, fmt: str = "npy") -> int:
+    """Writes the journal's results into an eval_dataset directory (game ids numbered across all files)."""
+    from eval_dataset import EvalDatasetWriter
+    records = Journal.read(job_dir)
+    game_ids: Dict[Tuple[int, int], int] = {}
+    results = sorted((r for r in records if r.get("t") == "r"), key=lambda r: (r["f"], r["g"], r["p"]))
+    with EvalDatasetWriter(dataset_dir, fmt=fmt) as writer:
+        for r in results:
+            game_id = game_ids.setdefault((r["f"], r["g"]), len(game_ids))
+            writer.add_row(game_id, r["p"], r["score"], r["mate"], r["bestmove"], r["depth"], r["nodes"], r["ms"])
+    return len(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable batch analysis of PGN archives.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="Start a job, or resume the job already in job_dir")
+    p_run.add_argument("job_dir"); p_run.add_argument("pgn", nargs="*")
+    p_run.add_argument("--engine", default=None); p_run.add_argument("--workers", type=int, default=None)
+    p_run.add_argument("--movetime", type=int, default=500); p_run.add_argument("--max-attempts", type=int, default=3)
+    add_profile_arguments(p_run)
+    p_status = sub.add_parser("status"); p_status.add_argument("job_dir")
+    p_export = sub.add_parser("export", help="Write results to a columnar eval dataset")
+    p_export.add_argument("job_dir"); p_export.add_argument("dataset_dir")
+    p_export.add_argument("--format", choices=("npy", "parquet"), default="npy")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        engine_path = args.engine or locate_engine()
+        if not engine_path: parser.error("Engine not found; pass --engine.")
+        with maybe_profile(args, "batch_analysis"), EnginePool(engine_path, console_logger, size=args.workers) as engine_pool:
+            BatchAnalysisJob(args.job_dir, args.pgn, engine_pool, args.movetime, args.max_attempts).run()
+    elif args.command == "status":
+        state = JobState(Journal.read(args.job_dir))
+        console_logger(f"{len(state.header['files']) if state.header else 0} files, {len(state.done_games)} games done, "
+                       f"{state.results} positions analysed, {state.failures} failed.", "user")
+    else:
+        console_logger(f"Exported {export_dataset(args.job_dir, args.dataset_dir, args.format)} rows to {args.dataset_dir}.", "user")
@@ -0,0 +1,77 @@
+import tkinter as tk
+from typing import Dict, Iterable, Optional, Tuple
+
+import chess
+from PIL import ImageTk
+
+import instrumentation
+from fen_renderer import GameRenderer
+
+class BoardView(tk.Canvas):
+    """
+    Tk canvas showing a chess.Board drawn with the fen_renderer assets.
+    - GameRenderer composes each square tile (board texture, optional highlight, piece) once, and the
+      tile is kept as a PhotoImage.
+    - Each of the 64 squares is one canvas image item. show() only re-points the items whose square
+      changed, so stepping between positions costs a few itemconfigure calls and no PNG decoding or scaling.
+    """
+    def __init__(self, master, assets_dir: str, size: int = 320, flipped: bool = False, board_image: str = "board.png", **kwargs):
+        self.assets_dir: str = assets_dir
+        self.board_image: str = board_image
+        self.renderer: GameRenderer = GameRenderer(assets_dir, board_image, size=size, flipped=flipped)
+        super().__init__(master, width=self.renderer.size, height=self.renderer.size, highlightthickness=0, bd=0, **kwargs)
+        self._photos: Dict[Tuple[chess.Square, Optional[str], bool], ImageTk.PhotoImage] = {}
+        self._shown: Dict[chess.Square, Tuple[Optional[str], bool]] = {} # square -> (piece symbol, highlighted) on screen
+        self._items: Dict[chess.Square, int] = {square: self.create_image(*self.renderer.square_origin(square), anchor="nw")
+                                                 for square in chess.SQUARES}
+        self._arrow_item: Optional[int] = None
+        self._last: Optional[Tuple[chess.Board, Tuple[chess.Square, ...], Optional[chess.Move]]] = None # for set_flipped
+
+    @property
+    def flipped(self) -> bool:
+        return self.renderer.flipped
+
+    def _photo(self, square: chess.Square, symbol: Optional[str], highlighted: bool) -> ImageTk.PhotoImage:
+        key = (square, symbol, highlighted)
+        if (photo := self._photos.get(key)) is None:
+            photo = self._photos[key] = ImageTk.PhotoImage(self.renderer.tile(square, symbol, highlighted), master=self)
+        return photo
+
+    def show(self, board: chess.Board, highlights: Optional[Iterable[chess.Square]] = None,
+             arrow: Optional[chess.Move] = None) -> int:
+        """
+        Displays `board`, highlighting `highlights` (default: the last move's squares) and drawing an
+        optional arrow. Returns how many squares had to be redrawn.
+        """
+        with instrumentation.span("board_view_update"):
+            if highlights is None:
+                highlights = (board.peek().from_square, board.peek().to_square) if board.move_stack else ()
+            highlighted = set(highlights)
+            pieces = board.piece_map()
+            redrawn = 0
+            for square in chess.SQUARES:
+                piece = pieces.get(square)
+                state = (piece.symbol() if piece else None, square in highlighted)
+                if self._shown.get(square) == state: continue
+                self.itemconfigure(self._items[square], image=self._photo(square, *state))
+                self._shown[square] = state; redrawn += 1
+            self._draw_arrow(arrow)
+            self._last = (board.copy(stack=False), tuple(highlighted), arrow)
+        return redrawn
+
+    def _draw_arrow(self, move: Optional[chess.Move]) -> None:
+        if self._arrow_item is not None: self.delete(self._arrow_item); self._arrow_item = None
+        if move is None: return
+        half = self.renderer.square_size / 2
+        (x0, y0), (x1, y1) = [(x + half, y + half) for x, y in map(self.renderer.square_origin, (move.from_square, move.to_square))]
+        color = "#{:02x}{:02x}{:02x}".format(*self.renderer.arrow_color[:3])
+        self._arrow_item = self.create_line(x0, y0, x1, y1, fill=color, width=max(2, self.renderer.square_size // 7), arrow=tk.LAST,
+                                            arrowshape=(self.renderer.square_size * 0.4, self.renderer.square_size * 0.4, self.renderer.square_size * 0.2))
+
+    def set_flipped(self, flipped: bool) -> None:
+        """Turns the board around. Tiles are per square texture, so this drops the tile cache and repaints everything."""
+        if flipped == self.renderer.flipped: return
+        self.renderer = GameRenderer(self.assets_dir, self.board_image, size=self.renderer.size, flipped=flipped)
+        self._photos.clear(); self._shown.clear()
+        for square, item in self._items.items(): self.coords(item, *self.renderer.square_origin(square))
+        if self._last is not None: self.show(*self._last)
@@ -1,8 +1,12 @@
 import chess
-from typing import Callable, Optional, Tuple
+import chess.pgn
+from typing import Callable, Iterator, List, Optional, Tuple
 from bs4 import BeautifulSoup, NavigableString # For extract_san_from_ply_div
 import re # For extract_san_from_ply_div
+import io
+import os
 
+import instrumentation
 # Import specific constants needed by this module directly
 from config import BOARD_OFFSET_X, BOARD_OFFSET_Y, SQUARE_PIXEL_SIZE, PLAYER_PERSPECTIVE_DEFAULT_FALLBACK
 
@@ -73,4 +77,42 @@ def extract_san_from_ply_div(ply_div: BeautifulSoup) -> Optional[str]:
         piece_map = {"Pawn": "", "Knight": "N", "Bishop": "B", "Rook": "R", "Queen": "Q", "King": "K"}
         cleaned = piece_map[m.group(1).capitalize()] + m.group(2)
 
-    return cleaned if cleaned else None
\ No newline at end of file
+    return cleaned if cleaned else None
+
+def game_fens(game: chess.pgn.Game) -> Tuple[List[str], List[chess.Move]]:
+    """
+    FENs of every position in a game's mainline (start position first, final position last) and the moves between them.
+    """
+    with instrumentation.span("board_replay"):
+        board = game.board()
+        fens, moves = [board.fen()], []
+        for move in game.mainline_moves():
+            board.push(move); fens.append(board.fen()); moves.append(move)
+    return fens, moves
+
+def iter_pgn_games(path: str) -> Iterator[chess.pgn.Game]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while (game := chess.pgn.read_game(f)) is not None: yield game
+
+def iter_pgn_games_with_offsets(path: str, start_offset: int = 0) -> Iterator[Tuple[int, int, chess.pgn.Game]]:
+    """
+    Streams (byte offset of game, byte offset after game, game) from a PGN file, starting at start_offset.
+    Offsets can be passed back to resume streaming or to seek straight to one game.
+    """
+    with open(path, "rb") as raw:
+        raw.seek(start_offset)
+        pgn = io.TextIOWrapper(raw, encoding="utf-8", errors="replace", newline="")
+        # TextIOWrapper.tell() is a byte offset whenever the decoder is flushed, which it is between games.
+        offset = pgn.tell()
+        while (game := chess.pgn.read_game(pgn)) is not None:
+            end = pgn.tell()
+            yield offset, end, game
+            offset = end
+
+def console_logger(message: str, log_type: str = "user") -> None:
+    """
+    Logger with the same (message, log_type) signature as ChessApp.add_to_output, for command-line tools.
+    Debug messages are only printed when CHESS_BOT_DEBUG is set in the environment.
+    """
+    if log_type == "user" or os.environ.get("CHESS_BOT_DEBUG"):
+        print(message if log_type == "user" else f"[debug] {message}", flush=True)
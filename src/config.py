@@ -25,10 +25,14 @@ CHESS_PASSWORD: str | None = config_env.get("CHESS_PASSWORD")
 DEFAULT_ENGINE_NAME: str = "Ethereal-9.00" 
 ENGINE_PATH_LOCAL: str = f'src/{DEFAULT_ENGINE_NAME}' 
 ENGINE_PATH_LOCAL_EXE: str = f"src/{DEFAULT_ENGINE_NAME}.exe"
+# Extra UCI engines and per-engine option profiles (see load_engine_registry in engine_pool.py), e.g.
+# {"stockfish": {"path": "/usr/games/stockfish", "options": {"Threads": 1, "Hash": 64}}}
+ENGINES_FILE: str = os.environ.get("CHESS_BOT_ENGINES") or config_env.get("CHESS_BOT_ENGINES") or os.path.join(BASE_DIR, "engines.json")
 
 WINDOW_TITLE: str = "Chess_Bot_v1.3.3" 
 DEFAULT_WINDOW_SIZE: str = '450x700'
 DEBUG_WINDOW_SIZE: str = '450x850'
+BOARD_VIEW_SIZE: int = 320 # pixels; the window grows by this much while the board view is shown
 
 SCREEN_WIDTH: int = 2560
 SCREEN_HEIGHT: int = 1560
@@ -37,6 +41,19 @@ BOARD_OFFSET_Y: int = 272
 SQUARE_PIXEL_SIZE: int = 144
 BOARD_PIXEL_SIZE: int = SQUARE_PIXEL_SIZE * 8
 
+# --- Engine Pool Configuration (batch tools) ---
+ENGINE_POOL_THREADS_PER_ENGINE: int = 1
+ENGINE_POOL_HASH_MB: int = 64           # Requested hash per engine; capped so the pool fits in ENGINE_POOL_MEMORY_FRACTION of free RAM
+ENGINE_POOL_MEMORY_FRACTION: float = 0.5
+ENGINE_POOL_PIN_CPUS: bool = True       # Give each engine its own CPU set (Linux)
+ENGINE_POOL_NICE: int = 5               # Lower engine priority so batch work yields to interactive use
+
+# --- Instrumentation (see instrumentation.py; set in .env or the environment) ---
+METRICS_ENABLED: bool = bool(os.environ.get("CHESS_BOT_METRICS") or config_env.get("CHESS_BOT_METRICS"))
+METRICS_HTTP_PORT: int | None = int(port) if (port := os.environ.get("CHESS_BOT_METRICS_PORT") or config_env.get("CHESS_BOT_METRICS_PORT")) else None
+METRICS_JSON_PATH: str | None = os.environ.get("CHESS_BOT_METRICS_JSON") or config_env.get("CHESS_BOT_METRICS_JSON")
+METRICS_JSON_INTERVAL_S: float = 10.0
+
 FAILSAFE_KEY: str = "esc"
 PLAYER_PERSPECTIVE_DEFAULT_FALLBACK: str = "white_bottom"
 
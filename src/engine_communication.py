@@ -1,26 +1,77 @@
+import queue
 import subprocess
+import threading
 import time
 import os
-from typing import Callable, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
 import chess # Keep for board = chess.Board(fen) if needed, but not for perspective here
 
+import instrumentation
+
+_INFO_INT_FIELDS = ("depth", "seldepth", "multipv", "nodes", "nps", "time", "hashfull", "tbhits")
+
+def parse_info_line(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses a UCI 'info' line into a dict of its integer fields plus 'score'/'mate' and 'pv'.
+    Returns None for info lines without search data (e.g. 'info string ...').
+    """
+    parts = line.split()
+    if not parts or parts[0] != "info" or "string" in parts[1:2]: return None
+    info: Dict[str, Any] = {}
+    i = 1
+    while i < len(parts):
+        token = parts[i]
+        try:
+            if token in _INFO_INT_FIELDS: info[token] = int(parts[i + 1]); i += 2
+            elif token == "score":
+                kind, value = parts[i + 1], int(parts[i + 2])
+                info["score"] = value; info["mate"] = kind == "mate"; i += 3
+                if i < len(parts) and parts[i] in ("lowerbound", "upperbound"): info["bound"] = parts[i]; i += 1
+            elif token == "pv": info["pv"] = parts[i + 1:]; break
+            else: i += 1
+        except (ValueError, IndexError): break
+    return info or None
+
+MATE_SCORE_CP = 10000
+
+def score_to_cp(score: Optional[int], is_mate: bool) -> Optional[int]:
+    """Folds a (score, is_mate) pair into one centipawn scale; mate in n maps to +/-(MATE_SCORE_CP - n)."""
+    if score is None or not is_mate: return score
+    return MATE_SCORE_CP - score if score > 0 else -MATE_SCORE_CP - score
+
 class ChessEngineCommunicator:
-    def __init__(self, engine_path: str, logger_func: Callable[[str, str], None]):
+    def __init__(self, engine_path: str, logger_func: Callable[[str, str], None],
+                 options: Optional[Dict[str, Any]] = None,
+                 cpu_affinity: Optional[Set[int]] = None, nice: Optional[int] = None):
         self.engine_path: str = engine_path
         self.logger: Callable[[str, str], None] = logger_func
+        self.options: Dict[str, Any] = dict(options or {}) # UCI options applied after the defaults on every (re)start
+        self.cpu_affinity: Optional[Set[int]] = set(cpu_affinity) if cpu_affinity else None # CPUs the engine may run on (Linux)
+        self.nice: Optional[int] = nice # niceness increment; on Windows > 0 maps to below-normal/idle priority class
         self.engine_process: Optional[subprocess.Popen] = None
+        self._output: Optional["queue.Queue[Optional[str]]"] = None # lines of the current process; None marks its end
+        self._multipv: int = 1
         self._start_engine()
 
     def _start_engine(self) -> None:
         try:
             self.logger(f"Starting chess engine: {self.engine_path}", log_type="debug")
             creationflags = 0
-            if os.name == 'nt': creationflags = subprocess.CREATE_NO_WINDOW
-            self.engine_process = subprocess.Popen(
-                [self.engine_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                text=True, bufsize=1, universal_newlines=True, creationflags=creationflags
-            )
-            self._initialize_uci()
+            if os.name == 'nt':
+                creationflags = subprocess.CREATE_NO_WINDOW
+                if self.nice: creationflags |= subprocess.IDLE_PRIORITY_CLASS if self.nice >= 15 else subprocess.BELOW_NORMAL_PRIORITY_CLASS
+            with instrumentation.span("engine_spawn"):
+                self.engine_process = subprocess.Popen(
+                    [self.engine_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    text=True, bufsize=1, universal_newlines=True, creationflags=creationflags
+                )
+                self._apply_process_limits()
+            self._output = queue.Queue()
+            threading.Thread(target=self._pump_output, args=(self.engine_process, self._output),
+                             name=f"engine-output-{self.engine_process.pid}", daemon=True).start()
+            self._multipv = 1
+            with instrumentation.span("uci_handshake"): self._initialize_uci()
+            instrumentation.count("engine_starts_total")
             self.logger("Chess engine started and UCI initialized.", log_type="debug")
         except FileNotFoundError: self.logger(f"ERROR: Engine not found: {self.engine_path}", "debug"); self.engine_process = None; raise
         except OSError as e:
@@ -34,22 +85,32 @@ class ChessEngineCommunicator:
                 except: pass
             self.engine_process = None; raise
 
+    def _apply_process_limits(self) -> None:
+        # Applied to the child after spawn (rather than in preexec_fn, which is unsafe with threads) before it allocates hash or starts searching.
+        if not self.engine_process: return
+        pid = self.engine_process.pid
+        if self.cpu_affinity:
+            if hasattr(os, "sched_setaffinity"):
+                try: os.sched_setaffinity(pid, self.cpu_affinity)
+                except OSError as e: self.logger(f"Could not pin engine {pid} to CPUs {sorted(self.cpu_affinity)}: {e}", "debug")
+            else: self.logger("CPU pinning not supported on this platform; ignoring.", "debug")
+        if self.nice and os.name != 'nt' and hasattr(os, "setpriority"):
+            try: os.setpriority(os.PRIO_PROCESS, pid, min(19, os.getpriority(os.PRIO_PROCESS, pid) + self.nice))
+            except OSError as e: self.logger(f"Could not renice engine {pid}: {e}", "debug")
+
     def _initialize_uci(self) -> None:
         if not self.engine_process: return
         self.send_command("uci")
         uci_timeout = time.time() + 10; uciok = False
-        while time.time() < uci_timeout:
-            if (output := self.read_output_line()) is None: raise Exception("Engine died during UCI handshake.")
-            if "uciok" in output: uciok = True; break
-        if not uciok: raise Exception("Engine no uciok.")
-        self.send_command("isready")
-        ready_timeout = time.time() + 10; readyok = False
-        while time.time() < ready_timeout:
-            if (output := self.read_output_line()) is None: raise Exception("Engine died during isready.")
-            if "readyok" in output: readyok = True; break
-        if not readyok: raise Exception("Engine no readyok.")
+        try:
+            while not uciok:
+                if (output := self.read_output_line(uci_timeout - time.time())) is None: raise Exception("Engine died during UCI handshake.")
+                uciok = "uciok" in output
+        except TimeoutError: raise Exception("Engine no uciok.") from None
+        if not self._wait_ready(10.0): raise Exception("Engine no readyok.")
         self.send_command("setoption name Hash value 128")
         self.send_command("setoption name Threads value 2")
+        for name, value in self.options.items(): self.set_option(name, value)
 
     def send_command(self, command: str) -> None:
         if self.engine_process and self.engine_process.stdin and not self.engine_process.stdin.closed:
@@ -60,15 +121,136 @@ class ChessEngineCommunicator:
         elif self.engine_process and hasattr(self.engine_process.stdin, 'closed') and self.engine_process.stdin.closed:
              self.logger(f"ERROR: Engine stdin closed, cannot send '{command}'.", "debug"); self.engine_process = None
 
-    def read_output_line(self) -> Optional[str]:
-        if self.engine_process and self.engine_process.stdout and not self.engine_process.stdout.closed:
-            try:
-                output_line = self.engine_process.stdout.readline()
-                if not output_line and self.engine_process.poll() is not None: return None
-                return output_line.strip()
-            except Exception as e: self.logger(f"ERROR reading engine output: {e}", "debug"); return None
+    @staticmethod
+    def _pump_output(process: subprocess.Popen, lines: "queue.Queue[Optional[str]]") -> None:
+        # One daemon thread per engine process does the blocking readline, so readers can wait with a deadline.
+        try:
+            for line in iter(process.stdout.readline, ""): lines.put(line.strip())
+        except (OSError, ValueError): pass # pipe closed under us by stop_engine
+        lines.put(None)
+
+    def read_output_line(self, timeout_s: Optional[float] = None) -> Optional[str]:
+        """
+        Next line of engine output, or None once the engine's output has ended.
+        With timeout_s, raises TimeoutError if the engine writes nothing for that long (it may be hung).
+        """
+        lines = self._output
+        if not self.engine_process or lines is None: return None
+        try:
+            with instrumentation.span("engine_pipe_wait"): line = lines.get(timeout=None if timeout_s is None else max(0.0, timeout_s))
+        except queue.Empty: raise TimeoutError(f"No engine output for {timeout_s:.1f}s.") from None
+        if line is None: lines.put(None) # keep the end marker for the next reader
+        return line
+
+    def _ensure_running(self) -> bool:
+        if self.engine_process and self.engine_process.poll() is None: return True
+        self.logger("Engine not running. Attempting restart...", "debug")
+        if not self.engine_path: return False
+        try: self._start_engine()
+        except Exception as e: self.logger(f"Engine restart failed: {e}", "debug"); return False
+        return bool(self.engine_process and self.engine_process.poll() is None)
+
+    def restart_engine(self) -> bool:
+        self.stop_engine()
+        return self._ensure_running()
+
+    def _wait_ready(self, timeout_s: float = 5.0) -> bool:
+        self.send_command("isready")
+        ready_timeout = time.time() + timeout_s
+        try:
+            while (out := self.read_output_line(ready_timeout - time.time())) is not None:
+                if "readyok" in out: return True
+        except TimeoutError: pass
+        return False
+
+    def _abandon_search(self, fen: str) -> None:
+        # The search overran its deadline: stop it and consume its bestmove, or restart an engine that stays silent.
+        self.logger(f"No bestmove received/timeout. FEN: {fen}", "debug"); self.send_command("stop")
+        if not self._drain_until_bestmove():
+            self.logger("Engine did not answer 'stop'; restarting it.", "debug"); self.restart_engine()
+
+    def set_option(self, name: str, value: Any) -> None:
+        self.send_command(f"setoption name {name} value {value}")
+
+    def analyse(self, fen: str, movetime_ms: Optional[int] = None, depth: Optional[int] = None,
+                multipv: int = 1, new_game: bool = True,
+                on_info: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Runs one search and returns the full result instead of just (move, score):
+        bestmove, the last score/mate/depth/nodes/nps/pv of the main line, the final
+        info of every MultiPV line under 'lines', and every parsed info under 'infos'
+        (each stamped with 'elapsed' seconds since 'go'). Scores are side-to-move relative.
+        Returns None if the engine is unavailable or the search timed out.
+        """
+        if not self._ensure_running(): return None
+        with instrumentation.span("engine_search"): result = self._analyse(fen, movetime_ms, depth, multipv, new_game, on_info)
+        if result is None: instrumentation.count("engine_search_failures_total"); return None
+        instrumentation.count("engine_searches_total"); instrumentation.count("engine_nodes_total", result["nodes"])
+        if result["nps"]: instrumentation.observe("engine_nps", result["nps"], instrumentation.NPS_BUCKETS)
+        return result
+
+    def _analyse(self, fen: str, movetime_ms: Optional[int], depth: Optional[int], multipv: int, new_game: bool,
+                 on_info: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[Dict[str, Any]]:
+        if new_game: self.send_command("ucinewgame")
+        if multipv != self._multipv: self.set_option("MultiPV", multipv); self._multipv = multipv
+        if not self._wait_ready():
+            self.logger("Engine not ready for analysis; restarting it.", "debug"); self.restart_engine(); return None
+
+        self.send_command(f"position fen {fen}")
+        if depth is not None: go = f"go depth {depth}" + (f" movetime {movetime_ms}" if movetime_ms else "")
+        else: go = f"go movetime {movetime_ms if movetime_ms else 2000}"
+        self.send_command(go)
+
+        result: Dict[str, Any] = {"fen": fen, "bestmove": None, "ponder": None, "score": None, "mate": False,
+                                  "depth": 0, "seldepth": 0, "nodes": 0, "nps": 0, "pv": [], "lines": {}, "infos": []}
+        start_time = time.time()
+        deadline = start_time + ((movetime_ms or 0) / 1000.0) + (60.0 if depth is not None else 10.0)
+        while True:
+            try: output = self.read_output_line(deadline - time.time())
+            except TimeoutError: break
+            if output is None: return None
+            if output.startswith("info"):
+                with instrumentation.span("uci_parse"): info = parse_info_line(output)
+                if info is None or "score" not in info: continue
+                info["elapsed"] = time.time() - start_time
+                result["infos"].append(info)
+                result["lines"][info.get("multipv", 1)] = info
+                if info.get("multipv", 1) == 1:
+                    for key in ("score", "mate", "depth", "seldepth", "nodes", "nps", "pv"):
+                        if key in info: result[key] = info[key]
+                if on_info: on_info(info)
+            elif output.startswith("bestmove"):
+                parts = output.split()
+                result["bestmove"] = parts[1] if len(parts) > 1 else None
+                if len(parts) > 3 and parts[2] == "ponder": result["ponder"] = parts[3]
+                result["elapsed"] = time.time() - start_time
+                if not result["nps"] and result["elapsed"] > 0: result["nps"] = int(result["nodes"] / result["elapsed"])
+                return result
+        self._abandon_search(fen)
         return None
 
+    def start_infinite(self, fen: str, moves: Sequence[str] = (), multipv: int = 1, new_game: bool = False) -> bool:
+        """
+        Sends the position and 'go infinite' and returns without reading any output. The caller owns
+        stdout until it sends 'stop' and reads the bestmove. Without new_game the hash table is kept.
+        """
+        if not self._ensure_running(): return False
+        if new_game: self.send_command("ucinewgame")
+        if multipv != self._multipv: self.set_option("MultiPV", multipv); self._multipv = multipv
+        if not self._wait_ready(): self.logger("Engine not ready for infinite analysis.", "debug"); return False
+        self.send_command(f"position fen {fen}" + (f" moves {' '.join(moves)}" if moves else ""))
+        self.send_command("go infinite")
+        return True
+
+    def _drain_until_bestmove(self, timeout_s: float = 5.0) -> bool:
+        # After a 'stop' the engine still owes us a bestmove; consume it so the next search doesn't read it.
+        deadline = time.time() + timeout_s
+        try:
+            while (output := self.read_output_line(deadline - time.time())) is not None:
+                if output.startswith("bestmove"): return True
+        except TimeoutError: pass
+        return False
+
     def get_best_move_and_eval(self, fen: str, movetime_ms: int = 2000) -> Tuple[Optional[str], Optional[int], bool]:
         """
         Gets the best move and the evaluation score from the engine.
@@ -76,6 +258,11 @@ class ChessEngineCommunicator:
         from the perspective of the player whose turn it is in the FEN.
         Returns: (best_move, raw_score, is_mate_score)
         """
+        with instrumentation.span("engine_search"): best_move, raw_score, is_mate_score = self._get_best_move_and_eval(fen, movetime_ms)
+        instrumentation.count("engine_searches_total" if best_move else "engine_search_failures_total")
+        return best_move, raw_score, is_mate_score
+
+    def _get_best_move_and_eval(self, fen: str, movetime_ms: int) -> Tuple[Optional[str], Optional[int], bool]:
         if not self.engine_process or (self.engine_process.poll() is not None):
             self.logger("Engine not running. Attempting restart...", "debug")
             if self.engine_path:
@@ -85,12 +272,10 @@ class ChessEngineCommunicator:
                 except Exception as e: self.logger(f"Engine restart failed: {e}", "debug"); return None, None, False
             else: return None, None, False
 
-        self.send_command("ucinewgame"); self.send_command("isready")
-        ready_timeout = time.time() + 5; ready = False
-        while time.time() < ready_timeout:
-            if (out := self.read_output_line()) is None: return None, None, False
-            if "readyok" in out: ready = True; break
-        if not ready: self.logger("Engine not ready for new game.", "debug"); return None, None, False
+        if self._multipv != 1: self.set_option("MultiPV", 1); self._multipv = 1 # an earlier analyse() may have left MultiPV on
+        self.send_command("ucinewgame")
+        if not self._wait_ready():
+            self.logger("Engine not ready for new game; restarting it.", "debug"); self.restart_engine(); return None, None, False
 
         self.send_command(f"position fen {fen}"); self.send_command(f"go movetime {movetime_ms}")
 
@@ -98,12 +283,11 @@ class ChessEngineCommunicator:
         raw_score: Optional[int] = None
         is_mate_score: bool = False
 
-        start_time = time.time()
-        timeout_duration = (movetime_ms / 1000.0) + 10.0
+        deadline = time.time() + (movetime_ms / 1000.0) + 10.0
 
-        while time.time() - start_time < timeout_duration:
-            if self.engine_process and self.engine_process.poll() is not None: return None, None, False
-            output = self.read_output_line()
+        while True:
+            try: output = self.read_output_line(deadline - time.time())
+            except TimeoutError: self._abandon_search(fen); break
             if output is None: return None, None, False
 
             if output.startswith("info"):
@@ -128,8 +312,6 @@ class ChessEngineCommunicator:
                 parts = output.split(); best_move = parts[1] if len(parts) > 1 else None
                 break
 
-        if not best_move: self.logger(f"No bestmove received/timeout. FEN: {fen}", "debug"); self.send_command("stop")
-
         if best_move and raw_score is None:
             self.logger(f"Best move {best_move} found, but no eval score parsed.", "debug")
 
@@ -144,4 +326,4 @@ class ChessEngineCommunicator:
             except Exception:
                 try: self.engine_process.kill(); self.engine_process.communicate()
                 except Exception: pass
-        self.engine_process = None; self.logger("Chess engine stopped.", "debug")
\ No newline at end of file
+        self.engine_process = self._output = None; self.logger("Chess engine stopped.", "debug")
\ No newline at end of file
@@ -0,0 +1,136 @@
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from analysis_cluster import load_positions
+from chess_utils import console_logger
+from config import DEFAULT_ENGINE_NAME, ENGINE_POOL_MEMORY_FRACTION, ENGINES_FILE
+from engine_communication import ChessEngineCommunicator, score_to_cp
+from engine_pool import EnginePool, load_engine_registry, resolve_engine, usable_cpus
+from profiling import add_profile_arguments, maybe_profile
+
+EVAL_CLIP_CP = 1000 # evals are clipped before correlating so mates and lost positions do not dominate
+
+def measure_position(engine: ChessEngineCommunicator, fen: str, depth: Optional[int], movetime_ms: Optional[int]) -> Optional[Dict[str, Any]]:
+    """One search from a cleared hash; 'ttd' is the time the main line first reached `depth` (None in movetime mode)."""
+    res = engine.analyse(fen, movetime_ms=movetime_ms, depth=depth, new_game=True)
+    if res is None: return None
+    ttd = None
+    if depth is not None:
+        ttd = next((i["elapsed"] for i in res["infos"] if i.get("multipv", 1) == 1 and i.get("depth", 0) >= depth), res["elapsed"])
+    cp = score_to_cp(res["score"], res["mate"])
+    return {"bestmove": res["bestmove"], "cp": None if cp is None else max(-EVAL_CLIP_CP, min(EVAL_CLIP_CP, cp)),
+            "depth": res["depth"], "nodes": res["nodes"], "nps": res["nps"], "elapsed": res["elapsed"], "ttd": ttd}
+
+def run_engine(name: str, path: str, options: Dict[str, Any], fens: List[str], depth: Optional[int], movetime_ms: Optional[int],
+               size: int, cpus: Optional[List[int]], memory_fraction: float,
+               logger: Callable[[str, str], None] = console_logger) -> List[Optional[Dict[str, Any]]]:
+    with EnginePool(path, logger, size=size, options=options, pin_cpus=cpus is not None,
+                    memory_fraction=memory_fraction, cpus=cpus) as pool:
+        start = time.time()
+        results = pool.map(lambda engine, fen: measure_position(engine, fen, depth, movetime_ms), fens)
+    logger(f"{name}: {len(fens)} positions in {time.time() - start:.1f}s on {size} engine(s).", "user")
+    return results
+
+def _pearson(a: List[float], b: List[float]) -> Optional[float]:
+    if len(a) < 3 or np.std(a) == 0 or np.std(b) == 0: return None
+    return float(np.corrcoef(a, b)[0, 1])
+
+def compare(results: Dict[str, List[Optional[Dict[str, Any]]]]) -> Dict[str, Any]:
+    """Per-engine speed figures and pairwise best-move agreement / eval correlation over positions both engines answered."""
+    engines: Dict[str, Dict[str, Any]] = {}
+    for name, rows in results.items():
+        ok = [r for r in rows if r]
+        search_s = sum(r["elapsed"] for r in ok)
+        ttds = [r["ttd"] for r in ok if r["ttd"] is not None]
+        engines[name] = {
+            "positions": len(ok), "failures": len(rows) - len(ok),
+            "nps": int(sum(r["nodes"] for r in ok) / search_s) if search_s > 0 else 0,
+            "median_ttd_s": statistics.median(ttds) if ttds else None,
+            "mean_depth": sum(r["depth"] for r in ok) / len(ok) if ok else 0.0,
+        }
+    pairs = []
+    names = list(results)
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            both = [(x, y) for x, y in zip(results[a], results[b]) if x and y]
+            evals = [(x["cp"], y["cp"]) for x, y in both if x["cp"] is not None and y["cp"] is not None]
+            pairs.append({
+                "engines": [a, b], "positions": len(both),
+                "agreement": sum(x["bestmove"] == y["bestmove"] for x, y in both) / len(both) if both else None,
+                "eval_correlation": _pearson([e[0] for e in evals], [e[1] for e in evals]),
+                "mean_eval_diff_cp": sum(abs(x - y) for x, y in evals) / len(evals) if evals else None,
+            })
+    return {"engines": engines, "pairs": pairs}
+
+def compare_engines(names: List[str], fens: List[str], depth: Optional[int] = None, movetime_ms: Optional[int] = None,
+                    workers: Optional[int] = None, sequential: bool = False, registry: Optional[Dict[str, Dict[str, Any]]] = None,
+                    logger: Callable[[str, str], None] = console_logger) -> Dict[str, Any]:
+    """
+    Runs the same positions through every named engine and compares them. In parallel mode each engine
+    gets its own disjoint slice of the usable CPUs (pinned, when there are enough cores), so the engines
+    do not steal time from each other; sequential mode gives each engine the whole machine in turn.
+    """
+    registry = registry if registry is not None else load_engine_registry()
+    specs = {name: resolve_engine(name, registry) for name in names}
+    cpus = usable_cpus()
+    share = len(cpus) if sequential else len(cpus) // len(names)
+    results: Dict[str, List[Optional[Dict[str, Any]]]] = {}
+    def _job(index: int, name: str) -> None:
+        path, options = specs[name]
+        threads = int(options.get("Threads", 1))
+        size = workers or max(1, share // threads)
+        cpu_slice = None if sequential else cpus[index * share:(index + 1) * share]
+        if cpu_slice is not None and size * threads > len(cpu_slice):
+            logger(f"{name}: not enough cores for a separate CPU slice; engines will share cores and nps is not comparable.", "user")
+            cpu_slice = None
+        fraction = ENGINE_POOL_MEMORY_FRACTION / (1 if sequential else len(names))
+        results[name] = run_engine(name, path, options, fens, depth, movetime_ms, size, cpu_slice, fraction, logger)
+    if sequential:
+        for index, name in enumerate(names): _job(index, name)
+    else:
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            futures = {name: executor.submit(_job, index, name) for index, name in enumerate(names)}
+        for name, future in futures.items():
+            if future.exception() is not None: raise RuntimeError(f"Engine '{name}' failed: {future.exception()}") from future.exception()
+    report = compare({name: results[name] for name in names})
+    for name, row in report["engines"].items():
+        ttd = f"{row['median_ttd_s']:.2f}s" if row["median_ttd_s"] is not None else "-"
+        logger(f"{name:<24} nps {row['nps']:>10}  median time-to-depth {ttd:>7}  mean depth {row['mean_depth']:.1f}  "
+               f"failures {row['failures']}", "user")
+    for pair in report["pairs"]:
+        agreement = f"{pair['agreement']:.1%}" if pair["agreement"] is not None else "-"
+        corr = f"{pair['eval_correlation']:.3f}" if pair["eval_correlation"] is not None else "-"
+        diff = f"{pair['mean_eval_diff_cp']:.0f}cp" if pair["mean_eval_diff_cp"] is not None else "-"
+        logger(f"{pair['engines'][0]} vs {pair['engines'][1]}: best-move agreement {agreement}, eval correlation {corr}, "
+               f"mean |eval diff| {diff} over {pair['positions']} positions", "user")
+    return {**report, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare UCI engines on the same positions (nps, time-to-depth, agreement, eval correlation).")
+    parser.add_argument("positions", help="PGN, FEN or EPD file")
+    parser.add_argument("--engines", nargs="+", default=[DEFAULT_ENGINE_NAME], help=f"Registry names (from {ENGINES_FILE}) or executable paths")
+    parser.add_argument("--registry", default=ENGINES_FILE, help="Engine registry JSON")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int, default=None); limit.add_argument("--movetime", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Engine processes per engine (default: its share of the cores)")
+    parser.add_argument("--sequential", action="store_true", help="Run engines one after another on the whole machine")
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N positions")
+    parser.add_argument("--json", default=None)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    fens = load_positions(args.positions)[:args.limit]
+    depth = args.depth if args.depth or args.movetime else 12
+    try: registry = load_engine_registry(args.registry)
+    except (OSError, ValueError) as e: parser.error(f"Cannot read engine registry {args.registry}: {e}")
+    with maybe_profile(args, "engine_compare"):
+        try: report = compare_engines(args.engines, fens, depth, args.movetime, args.workers, args.sequential, registry)
+        except FileNotFoundError as e: parser.error(str(e))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
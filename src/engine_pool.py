@@ -0,0 +1,167 @@
+import json
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from chess_utils import console_logger
+from config import (
+    DEFAULT_ENGINE_NAME, ENGINE_PATH_LOCAL, ENGINE_PATH_LOCAL_EXE, BASE_DIR, ENGINES_FILE,
+    ENGINE_POOL_THREADS_PER_ENGINE, ENGINE_POOL_HASH_MB, ENGINE_POOL_MEMORY_FRACTION,
+    ENGINE_POOL_PIN_CPUS, ENGINE_POOL_NICE
+)
+from engine_communication import ChessEngineCommunicator
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+def locate_engine(engine_name: str = DEFAULT_ENGINE_NAME) -> Optional[str]:
+    """
+    Resolves an engine executable: an existing path is used as-is, the bundled engine paths are only
+    tried for DEFAULT_ENGINE_NAME, then engines next to the sources, then PATH. None if not found.
+    """
+    if os.path.isfile(engine_name): return engine_name
+    candidates = [ENGINE_PATH_LOCAL] if engine_name == DEFAULT_ENGINE_NAME else []
+    candidates.append(os.path.join(BASE_DIR, engine_name))
+    if os.name == 'nt':
+        if engine_name == DEFAULT_ENGINE_NAME: candidates.append(ENGINE_PATH_LOCAL_EXE)
+        candidates.append(os.path.join(BASE_DIR, f"{engine_name}.exe"))
+    for path in candidates:
+        if os.path.isfile(path): return path
+    return shutil.which(engine_name) or (os.name == 'nt' and shutil.which(f"{engine_name}.exe")) or None
+
+def load_engine_registry(path: Optional[str] = ENGINES_FILE) -> Dict[str, Dict[str, Any]]:
+    """
+    Named engine profiles, {name: {"path": executable or None, "options": {UCI option: value}}}.
+    The default engine is always present; entries in the engines file add to or override it.
+    """
+    registry: Dict[str, Dict[str, Any]] = {DEFAULT_ENGINE_NAME: {"path": None, "options": {}}}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for name, spec in json.load(f).items():
+                registry[name] = {"path": spec.get("path"), "options": dict(spec.get("options", {}))}
+    return registry
+
+def resolve_engine(name: str, registry: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    (executable, UCI options) for a registry name. Names not in the registry, including plain
+    executable paths, resolve like locate_engine with no extra options; FileNotFoundError if nothing matches.
+    """
+    spec = (registry if registry is not None else load_engine_registry()).get(name, {"path": None, "options": {}})
+    path = spec["path"] or locate_engine(name)
+    if not path: raise FileNotFoundError(f"Engine '{name}' not found; give it a path in {ENGINES_FILE}.")
+    return path, dict(spec["options"])
+
+def usable_cpus() -> List[int]:
+    """CPUs this process may run on (respects an inherited affinity mask / cgroup cpuset on Linux)."""
+    if hasattr(os, "sched_getaffinity"): return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def available_memory_mb() -> Optional[int]:
+    """Free physical memory in MB, or None if it cannot be determined."""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"): return int(line.split()[1]) // 1024
+    except OSError: pass
+    if os.name == 'nt':
+        import ctypes
+        class _MemoryStatusEx(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = _MemoryStatusEx(); status.dwLength = ctypes.sizeof(_MemoryStatusEx)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)): return status.ullAvailPhys // (1024 * 1024)
+        return None
+    try: return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError): return None
+
+def plan_pool(threads_per_engine: int = ENGINE_POOL_THREADS_PER_ENGINE, hash_mb: int = ENGINE_POOL_HASH_MB,
+              memory_fraction: float = ENGINE_POOL_MEMORY_FRACTION, size: Optional[int] = None,
+              logger: Callable[[str, str], None] = console_logger) -> Tuple[int, int]:
+    """
+    (engine count, hash MB per engine) for this machine: one engine per `threads_per_engine` usable cores,
+    and hash shrunk (to a power of two, at least 1 MB) so all engines together stay within memory_fraction of free RAM.
+    An explicit size is kept (with a warning if even 16 MB per engine would not fit); otherwise the count drops until it fits.
+    """
+    threads_per_engine = max(1, threads_per_engine)
+    explicit = size is not None
+    size = size or max(1, len(usable_cpus()) // threads_per_engine)
+    free_mb = available_memory_mb()
+    if free_mb is None: return size, hash_mb
+    budget_mb = int(free_mb * memory_fraction)
+    if size > 1 and budget_mb // size < 16:
+        if explicit: logger(f"{size} engines get under 16MB hash each in {budget_mb}MB of free memory; expect slow searches.", "user")
+        else: size = max(1, budget_mb // 16)
+    cap = max(1, budget_mb // size)
+    if hash_mb > cap: hash_mb = 1 << (cap.bit_length() - 1)
+    return size, hash_mb
+
+class EnginePool:
+    """
+    A fixed set of ChessEngineCommunicator processes shared by worker threads.
+    Each engine is its own OS process, so threads are enough to keep every core busy.
+    By default the pool sizes itself from the usable cores and free memory (plan_pool), pins each
+    engine to its own CPUs and runs the engines at a lower priority (see ENGINE_POOL_* in config).
+    Pinning starts at the first usable CPU, so pools that run side by side pass disjoint `cpus` slices
+    (an empty or too small slice leaves the engines unpinned).
+    """
+    def __init__(self, engine_path: str, logger_func: Callable[[str, str], None],
+                 size: Optional[int] = None, options: Optional[Dict[str, Any]] = None,
+                 pin_cpus: bool = ENGINE_POOL_PIN_CPUS, nice: Optional[int] = ENGINE_POOL_NICE,
+                 memory_fraction: float = ENGINE_POOL_MEMORY_FRACTION, cpus: Optional[List[int]] = None):
+        self.engine_path: str = engine_path
+        self.logger: Callable[[str, str], None] = logger_func
+        options = {"Threads": ENGINE_POOL_THREADS_PER_ENGINE, "Hash": ENGINE_POOL_HASH_MB, **(options or {})}
+        self.size, hash_mb = plan_pool(int(options["Threads"]), int(options["Hash"]), memory_fraction, size, logger_func)
+        if hash_mb != int(options["Hash"]): self.logger(f"Hash capped from {options['Hash']}MB to {hash_mb}MB per engine by free memory.", "debug")
+        self.options: Dict[str, Any] = {**options, "Hash": hash_mb}
+        self.nice: Optional[int] = nice
+        self._cpu_sets: List[Optional[Set[int]]] = [None] * self.size
+        cpus, per_engine = usable_cpus() if cpus is None else cpus, int(options["Threads"]) # cpus: a slice of the machine when pools run side by side
+        if pin_cpus and self.size * per_engine <= len(cpus):
+            self._cpu_sets = [set(cpus[i * per_engine:(i + 1) * per_engine]) for i in range(self.size)]
+        self.engines: List[ChessEngineCommunicator] = []
+        self._idle: "queue.Queue[ChessEngineCommunicator]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.logger(f"Starting engine pool: {self.size} x {engine_path} {self.options}"
+                    f"{' pinned' if self._cpu_sets[0] else ''}{f' nice +{nice}' if nice else ''}", "debug")
+        for cpu_set in self._cpu_sets: self._idle.put(self._spawn(cpu_set))
+
+    def _spawn(self, cpu_set: Optional[Set[int]] = None) -> ChessEngineCommunicator:
+        engine = ChessEngineCommunicator(self.engine_path, self.logger, options=self.options, cpu_affinity=cpu_set, nice=self.nice)
+        with self._lock: self.engines.append(engine)
+        return engine
+
+    @contextmanager
+    def engine(self) -> Iterator[ChessEngineCommunicator]:
+        engine = self._idle.get()
+        try: yield engine
+        finally: self._idle.put(engine)
+
+    def map(self, func: Callable[[ChessEngineCommunicator, T], R], items: Iterable[T],
+            on_result: Optional[Callable[[int, R], None]] = None) -> List[R]:
+        """
+        Runs func(engine, item) for every item across the pool and returns results in input order.
+        on_result(index, result) is called from the worker thread as each item completes.
+        """
+        def _run(indexed):
+            index, item = indexed
+            with self.engine() as engine: res = func(engine, item)
+            if on_result: on_result(index, res)
+            return res
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(_run, enumerate(items)))
+
+    def close(self) -> None:
+        with self._lock: engines, self.engines = self.engines, []
+        for engine in engines: engine.stop_engine()
+
+    def __enter__(self) -> "EnginePool": return self
+
+    def __exit__(self, *exc) -> None: self.close()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import chess
+
+from chess_utils import console_logger
+from engine_communication import ChessEngineCommunicator
+from engine_pool import EnginePool, locate_engine
+from profiling import add_profile_arguments, maybe_profile
+
+def load_epd(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads an EPD suite (one position per line, bm/am/id opcodes) into a list of position dicts.
+    Lines that fail to parse are reported and skipped.
+    """
+    positions = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"): continue
+            try: board, ops = chess.Board.from_epd(line)
+            except ValueError as e: console_logger(f"Skipping line {line_no}: {e}", "user"); continue
+            positions.append({
+                "id": str(ops.get("id", f"line {line_no}")), "fen": board.fen(),
+                "bm": [m.uci() for m in ops.get("bm", [])], "am": [m.uci() for m in ops.get("am", [])],
+            })
+    return positions
+
+def is_solution(move: Optional[str], position: Dict[str, Any]) -> bool:
+    if not move: return False
+    if position["bm"] and move not in position["bm"]: return False
+    return move not in position["am"]
+
+def time_to_solution(infos: List[Dict[str, Any]], position: Dict[str, Any]) -> Optional[float]:
+    """Elapsed seconds from which the main line's first move was a solution and stayed one."""
+    tts: Optional[float] = None
+    for info in infos:
+        if info.get("multipv", 1) != 1 or not info.get("pv"): continue
+        if is_solution(info["pv"][0], position):
+            if tts is None: tts = info["elapsed"]
+        else: tts = None
+    return tts
+
+def solve_position(engine: ChessEngineCommunicator, position: Dict[str, Any],
+                   movetime_ms: Optional[int], depth: Optional[int]) -> Dict[str, Any]:
+    res = engine.analyse(position["fen"], movetime_ms=movetime_ms, depth=depth)
+    if res is None:
+        return {**position, "solved": False, "bestmove": None, "tts": None, "depth": 0, "nodes": 0, "nps": 0, "time": 0.0, "error": True}
+    solved = is_solution(res["bestmove"], position)
+    return {
+        **position, "solved": solved, "bestmove": res["bestmove"],
+        "tts": time_to_solution(res["infos"], position) if solved else None,
+        "depth": res["depth"], "nodes": res["nodes"], "nps": res["nps"], "time": res["elapsed"], "error": False,
+    }
+
+def summarize(results: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    solved = [r for r in results if r["solved"]]
+    total_nodes = sum(r["nodes"] for r in results)
+    search_time = sum(r["time"] for r in results)
+    tts_values = [r["tts"] for r in solved if r["tts"] is not None]
+    return {
+        "positions": len(results), "solved": len(solved),
+        "solve_rate": len(solved) / len(results) if results else 0.0,
+        "errors": sum(1 for r in results if r["error"]),
+        "mean_tts": sum(tts_values) / len(tts_values) if tts_values else None,
+        "total_nodes": total_nodes, "wall_time": wall_time,
+        "aggregate_nps": int(total_nodes / wall_time) if wall_time > 0 else 0,   # throughput of the whole pool
+        "per_engine_nps": int(total_nodes / search_time) if search_time > 0 else 0,
+    }
+
+def run_suite(epd_path: str, engine_path: str, movetime_ms: Optional[int] = 1000, depth: Optional[int] = None,
+              workers: Optional[int] = None, options: Optional[Dict[str, Any]] = None,
+              logger=console_logger) -> Dict[str, Any]:
+    positions = load_epd(epd_path)
+    logger(f"Loaded {len(positions)} positions from {epd_path}.", "user")
+    def _report(index: int, r: Dict[str, Any]) -> None:
+        status = "OK  " if r["solved"] else ("ERR " if r["error"] else "FAIL")
+        tts = f"{r['tts']:.2f}s" if r["tts"] is not None else "-"
+        logger(f"{status} {r['id']:<24} best={r['bestmove']} want={'/'.join(r['bm']) or '!' + '/'.join(r['am'])} "
+               f"tts={tts} depth={r['depth']} nps={r['nps']}", "user")
+    start = time.time()
+    with EnginePool(engine_path, logger, size=workers, options=options) as pool:
+        results = pool.map(lambda engine, pos: solve_position(engine, pos, movetime_ms, depth), positions, on_result=_report)
+    summary = summarize(results, time.time() - start)
+    mean_tts = f"{summary['mean_tts']:.2f}s" if summary["mean_tts"] is not None else "-"
+    logger(f"Solved {summary['solved']}/{summary['positions']} ({summary['solve_rate']:.1%}), errors {summary['errors']}, "
+           f"mean time-to-solution {mean_tts}, aggregate nps {summary['aggregate_nps']} "
+           f"({summary['per_engine_nps']} per engine), wall {summary['wall_time']:.1f}s", "user")
+    return {"summary": summary, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an EPD test suite (bm/am) through the engine pool.")
+    parser.add_argument("epd", help="EPD file, e.g. WAC.epd")
+    parser.add_argument("--engine", default=None, help="Engine executable (default: locate the configured engine)")
+    parser.add_argument("--movetime", type=int, default=1000, help="Milliseconds per position")
+    parser.add_argument("--depth", type=int, default=None, help="Search to fixed depth instead of movetime")
+    parser.add_argument("--workers", type=int, default=None, help="Engine processes (default: one per core)")
+    parser.add_argument("--hash", type=int, default=64, help="Hash MB per engine")
+    parser.add_argument("--json", default=None, help="Write per-position results and summary to this file")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    engine_path = args.engine or locate_engine()
+    if not engine_path: parser.error("Engine not found; pass --engine.")
+    with maybe_profile(args, "epd_solver"):
+        report = run_suite(args.epd, engine_path, movetime_ms=None if args.depth else args.movetime, depth=args.depth,
+                           workers=args.workers, options={"Threads": 1, "Hash": args.hash})
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
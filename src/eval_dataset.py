@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import chess
+import numpy as np
+
+from chess_utils import console_logger
+from game_store import encode_move, decode_move
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Parquet is optional; .npy chunks need only numpy
+    pa = None; pq = None
+
+# Column name -> (numpy dtype, array.array typecode). best_move uses the game_store 16-bit move code.
+COLUMNS: Dict[str, tuple] = {
+    "game": (np.uint32, "I"), "ply": (np.uint16, "H"),
+    "score": (np.int32, "i"), "mate": (np.bool_, "B"),
+    "best_move": (np.uint16, "H"), "depth": (np.uint16, "H"),
+    "nodes": (np.uint64, "Q"), "time_ms": (np.uint32, "I"),
+}
+NO_SCORE = np.iinfo(np.int32).min # score sentinel for plies the engine returned no eval for
+NO_MOVE = 0                       # a1a1 never occurs as a real move
+MANIFEST_NAME = "manifest.json"
+
+class EvalDatasetWriter:
+    """
+    Appends per-ply analysis rows to a dataset directory in fixed-size chunks.
+    Each chunk is one .npy file per column (or one Parquet file), so existing chunks are never rewritten
+    and a writer can reopen the directory and keep appending. Parquet stores `mate` as uint8, since Arrow
+    bit-packs bool columns.
+    """
+    def __init__(self, dataset_dir: str, chunk_rows: int = 100_000, fmt: str = "npy",
+                 logger_func: Callable[[str, str], None] = console_logger):
+        if fmt == "parquet" and pq is None: raise ValueError("Parquet output needs pyarrow installed.")
+        self.dataset_dir: str = dataset_dir
+        self.chunk_rows: int = chunk_rows
+        self.logger: Callable[[str, str], None] = logger_func
+        os.makedirs(dataset_dir, exist_ok=True)
+        self.manifest: Dict[str, Any] = _read_manifest(dataset_dir) or {"format": fmt, "columns": list(COLUMNS), "chunks": []}
+        if self.manifest["format"] != fmt: raise ValueError(f"Dataset is {self.manifest['format']}, not {fmt}.")
+        self._buffers: Dict[str, array] = {name: array(code) for name, (_, code) in COLUMNS.items()}
+
+    def add_row(self, game: int, ply: int, score: Optional[int], mate: bool = False,
+                best_move: Optional[str] = None, depth: int = 0, nodes: int = 0, time_ms: int = 0) -> None:
+        b = self._buffers
+        b["game"].append(game); b["ply"].append(ply)
+        b["score"].append(NO_SCORE if score is None else score); b["mate"].append(bool(mate))
+        b["best_move"].append(encode_move(chess.Move.from_uci(best_move)) if best_move and best_move != "(none)" else NO_MOVE)
+        b["depth"].append(depth); b["nodes"].append(nodes); b["time_ms"].append(time_ms)
+        if len(b["game"]) >= self.chunk_rows: self.flush()
+
+    def add_result(self, game: int, ply: int, result: Optional[Dict[str, Any]]) -> None:
+        """Adds one ChessEngineCommunicator.analyse() result (None = failed search)."""
+        if result is None: self.add_row(game, ply, None); return
+        self.add_row(game, ply, result["score"], result["mate"], result["bestmove"], result["depth"],
+                     result["nodes"], int(result.get("elapsed", 0.0) * 1000))
+
+    def flush(self) -> None:
+        rows = len(self._buffers["game"])
+        if not rows: return
+        name = f"chunk-{len(self.manifest['chunks']):06d}"
+        arrays = {col: np.frombuffer(buf, dtype=np.uint8 if col == "mate" else COLUMNS[col][0]).astype(COLUMNS[col][0], copy=False)
+                  for col, buf in self._buffers.items()}
+        if self.manifest["format"] == "parquet":
+            pq.write_table(pa.table({**arrays, "mate": arrays["mate"].view(np.uint8)}), os.path.join(self.dataset_dir, name + ".parquet"))
+        else:
+            chunk_dir = os.path.join(self.dataset_dir, name); os.makedirs(chunk_dir, exist_ok=True)
+            for col, values in arrays.items(): np.save(os.path.join(chunk_dir, f"{col}.npy"), values)
+        self.manifest["chunks"].append({"name": name, "rows": rows})
+        _write_manifest(self.dataset_dir, self.manifest)
+        self._buffers = {col: array(code) for col, (_, code) in COLUMNS.items()}
+        self.logger(f"Wrote {name} ({rows} rows) to {self.dataset_dir}.", "debug")
+
+    def close(self) -> None: self.flush()
+
+    def __enter__(self) -> "EvalDatasetWriter": return self
+
+    def __exit__(self, *exc) -> None: self.close()
+
+class EvalDataset:
+    """
+    Read side: .npy chunk columns are memory-mapped (np.load mmap_mode), so opening such a dataset copies
+    nothing. Parquet chunks are encoded and compressed, so they are decoded into memory on open.
+    column() only concatenates when the dataset has more than one chunk.
+    """
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir: str = dataset_dir
+        self.manifest: Dict[str, Any] = _read_manifest(dataset_dir) or {"format": "npy", "columns": list(COLUMNS), "chunks": []}
+        self.chunks: List[Dict[str, np.ndarray]] = [self._load_chunk(c["name"]) for c in self.manifest["chunks"]]
+
+    def _load_chunk(self, name: str) -> Dict[str, np.ndarray]:
+        if self.manifest["format"] == "parquet":
+            table = pq.read_table(os.path.join(self.dataset_dir, name + ".parquet"), memory_map=True)
+            chunk = {col: table.column(col).to_numpy() for col in self.manifest["columns"]}
+            chunk["mate"] = chunk["mate"].view(np.bool_) # uint8 on disk
+            return chunk
+        chunk_dir = os.path.join(self.dataset_dir, name)
+        return {col: np.load(os.path.join(chunk_dir, f"{col}.npy"), mmap_mode="r") for col in self.manifest["columns"]}
+
+    def __len__(self) -> int: return sum(c["rows"] for c in self.manifest["chunks"])
+
+    def column(self, name: str) -> np.ndarray:
+        parts = [chunk[name] for chunk in self.chunks]
+        if not parts: return np.zeros(0, dtype=COLUMNS[name][0])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def iter_chunks(self) -> Iterator[Dict[str, np.ndarray]]:
+        yield from self.chunks
+
+    def best_moves_uci(self, moves: np.ndarray) -> List[Optional[str]]:
+        return [decode_move(int(code)).uci() if code != NO_MOVE else None for code in moves]
+
+    def to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame({name: self.column(name) for name in self.manifest["columns"]})
+
+def _read_manifest(dataset_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    if not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as f: return json.load(f)
+
+def _write_manifest(dataset_dir: str, manifest: Dict[str, Any]) -> None:
+    tmp_path = os.path.join(dataset_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(dataset_dir, MANIFEST_NAME))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar per-ply evaluation datasets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import-json", help="Convert JSON-lines per-ply records (game, ply, score, mate, bestmove, depth, nodes, time_ms)")
+    p_import.add_argument("jsonl"); p_import.add_argument("dataset_dir")
+    p_import.add_argument("--format", choices=("npy", "parquet"), default="npy")
+    p_import.add_argument("--chunk-rows", type=int, default=100_000)
+    p_info = sub.add_parser("info", help="Summarize a dataset")
+    p_info.add_argument("dataset_dir")
+    args = parser.parse_args()
+
+    if args.command == "import-json":
+        with EvalDatasetWriter(args.dataset_dir, args.chunk_rows, args.format) as writer, open(args.jsonl, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip(): continue
+                rec = json.loads(line)
+                writer.add_row(rec["game"], rec["ply"], rec.get("score"), rec.get("mate", False), rec.get("bestmove"),
+                               rec.get("depth", 0), rec.get("nodes", 0), rec.get("time_ms", 0))
+    else:
+        dataset = EvalDataset(args.dataset_dir)
+        scores = dataset.column("score"); mates = dataset.column("mate")
+        valid = (scores != NO_SCORE) & ~mates
+        console_logger(f"{len(dataset)} rows in {len(dataset.chunks)} chunks ({dataset.manifest['format']}), "
+                       f"{len(np.unique(dataset.column('game')))} games", "user")
+        if valid.any():
+            console_logger(f"cp eval: mean {scores[valid].mean():+.1f}, |eval| > 300 on {(np.abs(scores[valid]) > 300).mean():.1%} of plies; "
+                           f"mate scores on {mates.sum()} plies; mean depth {dataset.column('depth').mean():.1f}", "user")
@@ -1,28 +1,62 @@
-from PIL import Image
+from PIL import Image, ImageDraw
 import numpy as np
+import argparse
+import io
 import os
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import chess
+import chess.pgn
+import chess.svg
+
+import instrumentation
+
+# Map FEN characters to filenames
+PIECE_FILES = {
+    'K': 'wk.png', 'Q': 'wq.png', 'R': 'wr.png',
+    'B': 'wb.png', 'N': 'wn.png', 'P': 'wp.png',
+    'k': 'bk.png', 'q': 'bq.png', 'r': 'br.png',
+    'b': 'bb.png', 'n': 'bn.png', 'p': 'bp.png',
+}
+_DITHER_NONE = getattr(Image, "Dither", Image).NONE
+_UCI_MOVE = re.compile(r"^[a-h][1-8][a-h][1-8][qrbn]?$") # anything else (e.g. SAN "a8=Q") is parsed as SAN
+
+@lru_cache(maxsize=None)
+def _load_rgba(path):
+    # Cached decode; callers must treat the returned image as read-only.
+    return Image.open(path).convert('RGBA')
+
+@lru_cache(maxsize=None)
+def _piece_sprite(assets_dir, symbol, square_size):
+    return _load_rgba(os.path.join(assets_dir, PIECE_FILES[symbol])).resize((square_size, square_size), Image.LANCZOS)
+
+@lru_cache(maxsize=None)
+def _scaled_board(path, size):
+    return _load_rgba(path).resize((size, size), Image.LANCZOS)
 
 def render_fen(fen, assets_dir='assets', output_dir='fen_rendered', board_image='board.png'):
+    with instrumentation.span("render_fen"): _render_fen(fen, assets_dir, output_dir, board_image)
+
+def _render_fen(fen, assets_dir, output_dir, board_image):
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
-    
+    result = _compose_fen(fen, assets_dir, board_image)
+    out_path = os.path.join(output_dir, f"{fen.replace('/', '_')}.png")
+    result.save(out_path)
+    print(f"Rendered → {out_path}")
+
+def _compose_fen(fen, assets_dir, board_image):
     # Load the board image
-    board_path = os.path.join(assets_dir, board_image)
-    board = Image.open(board_path).convert('RGBA')
+    board = _load_rgba(os.path.join(assets_dir, board_image))
     width, height = board.size
     square_size = width // 8
-    
+
     # Prepare a blank overlay
     overlay = Image.new('RGBA', board.size, (255, 255, 255, 0))
-    
-    # Map FEN characters to filenames
-    piece_map = {
-        'K': 'wk.png', 'Q': 'wq.png', 'R': 'wr.png',
-        'B': 'wb.png', 'N': 'wn.png', 'P': 'wp.png',
-        'k': 'bk.png', 'q': 'bq.png', 'r': 'br.png',
-        'b': 'bb.png', 'n': 'bn.png', 'p': 'bp.png',
-    }
-    
+
     # Iterate over ranks and files
     for rank_idx, rank in enumerate(fen.split()[0].split('/')):
         file_idx = 0
@@ -30,17 +64,272 @@ def render_fen(fen, assets_dir='assets', output_dir='fen_rendered', board_image=
             if c.isdigit():
                 file_idx += int(c)
             else:
-                fn = piece_map[c]
-                piece = Image.open(os.path.join(assets_dir, fn)).convert('RGBA')
-                piece = piece.resize((square_size, square_size), Image.LANCZOS)
+                piece = _piece_sprite(assets_dir, c, square_size)
                 overlay.paste(piece, (file_idx * square_size, rank_idx * square_size), piece)
                 file_idx += 1
 
-    result = Image.alpha_composite(board, overlay)
-    out_path = os.path.join(output_dir, f"{fen.replace('/', '_')}.png")
-    result.save(out_path)
+    return Image.alpha_composite(board, overlay)
+
+class GameRenderer:
+    """
+    Renders successive positions of a game onto one persistent canvas, repainting only the squares
+    whose contents (piece or highlight) changed since the previous frame. Square tiles are composed
+    once and cached; in palette mode (GIF) they are also quantized once against a shared palette,
+    so no frame is ever re-quantized.
+    """
+    def __init__(self, assets_dir='assets', board_image='board.png', size=480, flipped=False, palette=False,
+                 highlight_color=(255, 255, 0, 100), arrow_color=(30, 140, 230)):
+        self.assets_dir = assets_dir
+        self.square_size = size // 8
+        self.size = self.square_size * 8
+        self.flipped = flipped
+        self.mode = 'P' if palette else 'RGB'
+        self.highlight_color = highlight_color
+        self.arrow_color = arrow_color
+        self.board_image = _scaled_board(os.path.join(assets_dir, board_image), self.size)
+        self._highlight_layer = Image.new('RGBA', (self.square_size, self.square_size), highlight_color)
+        self._tiles: Dict[Tuple[int, Optional[str], bool], Image.Image] = {}
+        self._palette_image: Optional[Image.Image] = None
+        self._arrow_fill: Union[int, Tuple[int, int, int]] = arrow_color
+        if palette: self._build_palette()
+
+    def square_origin(self, square: chess.Square) -> Tuple[int, int]:
+        """Top-left pixel of a square on this renderer's board (honours flipped)."""
+        file_idx, rank_idx = chess.square_file(square), chess.square_rank(square)
+        if self.flipped: return (7 - file_idx) * self.square_size, rank_idx * self.square_size
+        return file_idx * self.square_size, (7 - rank_idx) * self.square_size
+
+    def _compose_tile(self, square: chess.Square, symbol: Optional[str], highlighted: bool) -> Image.Image:
+        x, y = self.square_origin(square)
+        tile = self.board_image.crop((x, y, x + self.square_size, y + self.square_size))
+        if highlighted: tile = Image.alpha_composite(tile, self._highlight_layer)
+        if symbol: tile = Image.alpha_composite(tile, _piece_sprite(self.assets_dir, symbol, self.square_size))
+        return tile.convert('RGB')
+
+    def _build_palette(self) -> None:
+        # Sample every tile kind once (all pieces on a light and a dark square, with and without highlight) plus the arrow colour.
+        sq = self.square_size
+        samples = [self._compose_tile(square, symbol, hl) for square in (chess.A1, chess.B1)
+                   for symbol in [None, *PIECE_FILES] for hl in (False, True)]
+        collage = Image.new('RGB', (sq * 8, sq * (len(samples) // 8 + 2)), self.arrow_color)
+        for i, tile in enumerate(samples): collage.paste(tile, ((i % 8) * sq, (i // 8) * sq))
+        self._palette_image = collage.quantize(colors=256)
+        self._arrow_fill = Image.new('RGB', (1, 1), self.arrow_color).quantize(palette=self._palette_image, dither=_DITHER_NONE).getpixel((0, 0))
+
+    def tile(self, square: chess.Square, symbol: Optional[str], highlighted: bool = False) -> Image.Image:
+        key = (square, symbol, highlighted)
+        if (cached := self._tiles.get(key)) is None:
+            cached = self._compose_tile(square, symbol, highlighted)
+            if self._palette_image is not None: cached = cached.quantize(palette=self._palette_image, dither=_DITHER_NONE)
+            self._tiles[key] = cached
+        return cached
+
+    def new_canvas(self) -> Image.Image:
+        canvas = Image.new(self.mode, (self.size, self.size))
+        if self._palette_image is not None: canvas.putpalette(self._palette_image.getpalette())
+        return canvas
+
+    def paint(self, canvas: Image.Image, pieces: Dict[chess.Square, chess.Piece], squares, highlights=()) -> None:
+        for square in squares:
+            piece = pieces.get(square)
+            canvas.paste(self.tile(square, piece.symbol() if piece else None, square in highlights), self.square_origin(square))
+
+    def draw_arrow(self, image: Image.Image, move: chess.Move) -> None:
+        half = self.square_size / 2
+        (x0, y0), (x1, y1) = [(x + half, y + half) for x, y in map(self.square_origin, (move.from_square, move.to_square))]
+        length = max(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5, 1.0)
+        ux, uy = (x1 - x0) / length, (y1 - y0) / length
+        head = self.square_size * 0.4
+        bx, by = x1 - ux * head, y1 - uy * head
+        draw = ImageDraw.Draw(image)
+        draw.line([(x0, y0), (bx, by)], fill=self._arrow_fill, width=max(2, self.square_size // 7))
+        draw.polygon([(x1, y1), (bx - uy * head * 0.6, by + ux * head * 0.6), (bx + uy * head * 0.6, by - ux * head * 0.6)], fill=self._arrow_fill)
+
+    def frames(self, board: chess.Board, moves: Sequence[chess.Move], best_moves: Optional[Sequence[Optional[chess.Move]]] = None,
+               highlight_last_move: bool = True) -> Iterator[Image.Image]:
+        """
+        Yields one independent image per position: the start position, then one per move.
+        best_moves[i] (optional) is drawn as an arrow on frame i.
+        """
+        board = board.copy(stack=False)
+        canvas = self.new_canvas()
+        pieces = board.piece_map()
+        self.paint(canvas, pieces, chess.SQUARES)
+        highlights: set = set()
+        for ply in range(len(moves) + 1):
+            if ply:
+                move = moves[ply - 1]
+                board.push(move)
+                new_pieces = board.piece_map()
+                new_highlights = {move.from_square, move.to_square} if highlight_last_move else set()
+                dirty = {sq for sq in pieces.keys() | new_pieces.keys() if pieces.get(sq) != new_pieces.get(sq)}
+                self.paint(canvas, new_pieces, dirty | (highlights ^ new_highlights), new_highlights)
+                pieces, highlights = new_pieces, new_highlights
+            frame = canvas.copy()
+            if best_moves and ply < len(best_moves) and best_moves[ply]: self.draw_arrow(frame, best_moves[ply])
+            yield frame
+
+def _resolve_game(source, start_fen: Optional[str] = None) -> Tuple[chess.Board, List[chess.Move]]:
+    """Accepts a chess.pgn.Game, a PGN file path, PGN text, a chess.Board with a move stack, or a list of UCI/SAN strings or Moves."""
+    if isinstance(source, chess.Board):
+        return source.root(), list(source.move_stack)
+    if isinstance(source, str):
+        if os.path.exists(source):
+            with open(source, encoding="utf-8", errors="replace") as f: source = chess.pgn.read_game(f)
+        else: source = chess.pgn.read_game(io.StringIO(source))
+        if source is None: raise ValueError("No game found in PGN input.")
+    if isinstance(source, chess.pgn.Game):
+        return source.board(), list(source.mainline_moves())
+    board = chess.Board(start_fen or chess.STARTING_FEN)
+    replay, moves = board.copy(), []
+    for item in source:
+        move = item if isinstance(item, chess.Move) else (chess.Move.from_uci(item) if _UCI_MOVE.match(item) else replay.parse_san(item))
+        replay.push(move); moves.append(move)
+    return board, moves
+
+def render_game(source, output_path, assets_dir='assets', board_image='board.png', size=480, flipped=False,
+                duration_ms=600, highlight_last_move=True, best_moves=None, start_fen=None):
+    """
+    Renders a whole game as an animated GIF/WebP (by extension) or, for any other path, a directory of
+    numbered PNG frames. best_moves: optional per-ply UCI strings/Moves drawn as arrows (e.g. engine suggestions).
+    GIF is the fast path (palette tiles, no per-frame quantization); WebP time is dominated by the encoder.
+    Returns the number of frames written.
+    """
+    start = time.time()
+    board, moves = _resolve_game(source, start_fen)
+    arrows = [chess.Move.from_uci(m) if isinstance(m, str) else m for m in best_moves] if best_moves else None
+    ext = os.path.splitext(output_path)[1].lower()
+    renderer = GameRenderer(assets_dir, board_image, size, flipped, palette=(ext == '.gif'))
+    with instrumentation.span("render_frames"): frames = list(renderer.frames(board, moves, arrows, highlight_last_move))
+    instrumentation.count("render_frames_total", len(frames))
+    with instrumentation.span("render_encode"): _write_frames(frames, output_path, ext, duration_ms)
+    print(f"Rendered {len(frames)} frames → {output_path} in {time.time() - start:.2f}s")
+    return len(frames)
+
+def _write_frames(frames, output_path, ext, duration_ms):
+    if ext in ('.gif', '.webp'):
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        # Frames already differ only in the repainted squares; skip Pillow's extra GIF palette optimisation pass and use WebP's fastest method.
+        encoder_options = {'optimize': False} if ext == '.gif' else {'method': 0}
+        frames[0].save(output_path, save_all=True, append_images=frames[1:], duration=duration_ms, loop=0, **encoder_options)
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        for i, frame in enumerate(frames): frame.save(os.path.join(output_path, f"{i:04d}.png"), compress_level=1)
+
+@lru_cache(maxsize=None)
+def _svg_symbol(symbol):
+    # python-chess's vector pieces (45x45 units), wrapped once per piece as a symbol that scales to one square.
+    return f'<symbol id="{PIECE_FILES[symbol][:-4]}" viewBox="0 0 45 45">{chess.svg.PIECES[symbol]}</symbol>'
+
+def _svg_hex(rgb):
+    return f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
+
+def _svg_color(rgba):
+    return f'fill="{_svg_hex(rgba)}"' + (f' fill-opacity="{rgba[3] / 255:.2f}"' if len(rgba) > 3 else '')
+
+class SvgRenderer:
+    """
+    Vector counterpart of GameRenderer: one square is one user unit (viewBox 0 0 8 8), so the same
+    document serves any size. Squares are a single rect filled with a 2x2 checker pattern, each piece
+    type present is defined once as a <symbol> and placed with <use>, and arrowheads share one marker.
+    """
+    def __init__(self, size=480, flipped=False, light=(240, 217, 181), dark=(181, 136, 99),
+                 highlight_color=(255, 255, 0, 100), arrow_color=(30, 140, 230)):
+        self.size = size
+        self.flipped = flipped
+        self.highlight_color = highlight_color
+        self._arrow_stroke = _svg_hex(arrow_color)
+        self._pattern = (f'<pattern id="squares" width="2" height="2" patternUnits="userSpaceOnUse">'
+                         f'<rect width="2" height="2" {_svg_color(light)}/><rect x="1" width="1" height="1" {_svg_color(dark)}/>'
+                         f'<rect y="1" width="1" height="1" {_svg_color(dark)}/></pattern>')
+        self._marker = (f'<marker id="arrowhead" viewBox="0 0 10 10" markerWidth="3" markerHeight="3" refY="5" orient="auto">'
+                        f'<path d="M0 0L10 5L0 10z" fill="{self._arrow_stroke}"/></marker>')
+
+    def square_origin(self, square: chess.Square) -> Tuple[int, int]:
+        """Top-left corner of a square in board units (honours flipped)."""
+        file_idx, rank_idx = chess.square_file(square), chess.square_rank(square)
+        return (7 - file_idx, rank_idx) if self.flipped else (file_idx, 7 - rank_idx)
+
+    def _arrow(self, move: chess.Move) -> str:
+        (x0, y0), (x1, y1) = [(x + 0.5, y + 0.5) for x, y in map(self.square_origin, (move.from_square, move.to_square))]
+        length = max(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5, 1e-9)
+        head = 0.45 # marker length: markerWidth x stroke width
+        x1, y1 = x1 - (x1 - x0) / length * head, y1 - (y1 - y0) / length * head
+        return (f'<line x1="{x0:.3g}" y1="{y0:.3g}" x2="{x1:.3g}" y2="{y1:.3g}" stroke="{self._arrow_stroke}" stroke-width="0.15" '
+                f'marker-end="url(#arrowhead)"/>')
+
+    def render(self, board: Union[chess.Board, str], highlights: Optional[Sequence[chess.Square]] = None,
+               arrows: Sequence[chess.Move] = ()) -> str:
+        """
+        SVG document for a board or FEN. highlights default to the last move's squares (for a board with
+        a move stack); arrows are drawn from square centre to square centre.
+        """
+        board = chess.Board(board) if isinstance(board, str) else board
+        if highlights is None: highlights = (board.peek().from_square, board.peek().to_square) if board.move_stack else ()
+        pieces = board.piece_map()
+        defs = [self._pattern, *(_svg_symbol(symbol) for symbol in sorted({p.symbol() for p in pieces.values()}))]
+        if arrows: defs.append(self._marker)
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                 f'width="{self.size}" height="{self.size}" viewBox="0 0 8 8"><defs>{"".join(defs)}</defs>'
+                 f'<rect width="8" height="8" fill="url(#squares)"/>']
+        fill = _svg_color(self.highlight_color)
+        for square in highlights:
+            x, y = self.square_origin(square); parts.append(f'<rect x="{x}" y="{y}" width="1" height="1" {fill}/>')
+        for square, piece in pieces.items():
+            x, y = self.square_origin(square)
+            parts.append(f'<use xlink:href="#{PIECE_FILES[piece.symbol()][:-4]}" x="{x}" y="{y}" width="1" height="1"/>')
+        parts.extend(self._arrow(move) for move in arrows)
+        parts.append('</svg>')
+        return ''.join(parts)
+
+def render_fen_svg(fen, output_dir='fen_rendered', size=480, highlights=None, arrows=()):
+    """SVG counterpart of render_fen; arrows may be UCI strings or Moves."""
+    with instrumentation.span("render_fen_svg"):
+        os.makedirs(output_dir, exist_ok=True)
+        arrows = [chess.Move.from_uci(m) if isinstance(m, str) else m for m in arrows]
+        out_path = os.path.join(output_dir, f"{fen.split()[0].replace('/', '_')}.svg")
+        with open(out_path, 'w', encoding='utf-8') as f: f.write(SvgRenderer(size).render(fen, highlights, arrows))
     print(f"Rendered → {out_path}")
+    return out_path
+
+def benchmark_svg(fens, assets_dir='assets', board_image='board.png', size=480, repeat=3):
+    """
+    Renders the same positions through the render_fen raster path (PNG at the board image's size),
+    GameRenderer tiles (PNG at `size`) and SvgRenderer; reports positions/s and mean output bytes.
+    Encoding is included in the timings, since both paths end as a file.
+    """
+    tiles, svg = GameRenderer(assets_dir, board_image, size=size), SvgRenderer(size)
+    def _png(image):
+        buffer = io.BytesIO(); image.save(buffer, 'PNG'); return buffer.getvalue()
+    def _tiles(fen):
+        canvas = tiles.new_canvas(); tiles.paint(canvas, chess.Board(fen).piece_map(), chess.SQUARES); return _png(canvas)
+    paths = {'png (render_fen)': lambda fen: _png(_compose_fen(fen, assets_dir, board_image)),
+             f'png (tiles, {size}px)': _tiles,
+             'svg': lambda fen: svg.render(fen).encode('utf-8')}
+    results = {}
+    for name, render in paths.items():
+        sizes = [len(render(fen)) for fen in fens] # also warms the sprite/tile caches
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for fen in fens: render(fen)
+        elapsed = time.perf_counter() - start
+        results[name] = {'positions_per_s': repeat * len(fens) / elapsed, 'mean_bytes': sum(sizes) / len(sizes)}
+        print(f"{name:<20} {results[name]['positions_per_s']:>9.1f} positions/s  {results[name]['mean_bytes'] / 1024:>8.1f} KiB/position")
+    return results
 
 if __name__ == "__main__":
-    test_fen = "r3kb1r/pp4pp/2ppp3/3B4/6n1/5N2/PP3PPP/R1B1K2R w KQkq - 0 16"
-    render_fen(test_fen)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Render a FEN as PNG or SVG, or benchmark the two paths.")
+    parser.add_argument("fen", nargs="?", default="r3kb1r/pp4pp/2ppp3/3B4/6n1/5N2/PP3PPP/R1B1K2R w KQkq - 0 16")
+    parser.add_argument("--svg", action="store_true", help="Write an SVG instead of a PNG")
+    parser.add_argument("--size", type=int, default=480)
+    parser.add_argument("--arrow", action="append", default=[], help="UCI move drawn as an arrow (SVG, repeatable)")
+    parser.add_argument("--bench", default=None, help="FEN/EPD file to benchmark PNG against SVG rendering on")
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.bench:
+        with open(args.bench, encoding="utf-8") as f:
+            bench_fens = [chess.Board.from_epd(line.strip())[0].fen() for line in f if line.strip() and not line.startswith("#")]
+        benchmark_svg(bench_fens[:args.limit], size=args.size)
+    elif args.svg: render_fen_svg(args.fen, size=args.size, arrows=args.arrow)
+    else: render_fen(args.fen)
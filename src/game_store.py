@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import chess
+import chess.pgn
+import numpy as np
+
+from chess_utils import console_logger
+
+HEADER_TAGS = ("Event", "Site", "Date", "Round", "White", "Black", "Result", "WhiteElo", "BlackElo", "ECO", "FEN")
+EXTRA_TAGS = "_extra" # column holding every other tag of a game, as one interned JSON object
+STORED_COLUMNS = HEADER_TAGS + (EXTRA_TAGS,)
+_FEN_COLUMN = HEADER_TAGS.index("FEN")
+
+# Move code: from(6 bits) | to(6 bits) << 6 | promotion piece type (0 = none, 2..5 = N..Q) << 12
+def encode_move(move: chess.Move) -> int:
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+def decode_move(code: int) -> chess.Move:
+    promotion = (code >> 12) & 0x7
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, promotion or None)
+
+class GameStoreBuilder:
+    """
+    Accumulates games into the packed arrays; save() writes them as a GameStore directory.
+    Only the mainline and the tags are kept: comments, NAGs and variations are dropped.
+    """
+    def __init__(self):
+        self.moves = array("H")
+        self.offsets = array("Q", [0])
+        self.header_cells = array("i")
+        self.strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+
+    def _intern(self, value: Optional[str]) -> int:
+        if value is None: return -1
+        if (sid := self._string_ids.get(value)) is None:
+            sid = self._string_ids[value] = len(self.strings); self.strings.append(value)
+        return sid
+
+    def add_moves(self, moves: Iterable[chess.Move], headers: Optional[Dict[str, str]] = None) -> None:
+        self.moves.extend(encode_move(m) for m in moves)
+        self.offsets.append(len(self.moves))
+        headers = headers or {}
+        extra = {tag: value for tag, value in headers.items() if tag not in HEADER_TAGS}
+        self.header_cells.extend(self._intern(headers.get(tag)) for tag in HEADER_TAGS)
+        self.header_cells.append(self._intern(json.dumps(extra, ensure_ascii=False) if extra else None))
+
+    def add_game(self, game: chess.pgn.Game) -> None:
+        headers = dict(game.headers)
+        if headers.get("FEN") == chess.STARTING_FEN: headers.pop("FEN")
+        self.add_moves(game.mainline_moves(), headers)
+
+    def add_board(self, board: chess.Board, headers: Optional[Dict[str, str]] = None) -> None:
+        headers = dict(headers or {})
+        root = board.root()
+        if root.fen() != chess.STARTING_FEN: headers["FEN"] = root.fen()
+        self.add_moves(board.move_stack, headers)
+
+    def __len__(self) -> int: return len(self.offsets) - 1
+
+    def save(self, store_dir: str) -> None:
+        os.makedirs(store_dir, exist_ok=True)
+        np.save(os.path.join(store_dir, "moves.npy"), np.frombuffer(self.moves, dtype=np.uint16) if self.moves else np.zeros(0, np.uint16))
+        np.save(os.path.join(store_dir, "offsets.npy"), np.frombuffer(self.offsets, dtype=np.uint64))
+        headers = np.frombuffer(self.header_cells, dtype=np.int32) if self.header_cells else np.zeros(0, np.int32)
+        np.save(os.path.join(store_dir, "headers.npy"), headers.reshape(-1, len(STORED_COLUMNS)))
+        with open(os.path.join(store_dir, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump({"tags": STORED_COLUMNS, "strings": self.strings}, f)
+
+class GameStore:
+    """
+    Read side of the packed format: 16-bit moves in one contiguous array, an offset index
+    (game i = moves[offsets[i]:offsets[i + 1]]) and a header table of interned strings.
+    The arrays are memory-mapped, so opening a store costs almost nothing until games are touched.
+    """
+    def __init__(self, store_dir: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        self.moves: np.ndarray = np.load(os.path.join(store_dir, "moves.npy"), mmap_mode=mode)
+        self.offsets: np.ndarray = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode=mode)
+        self.header_table: np.ndarray = np.load(os.path.join(store_dir, "headers.npy"), mmap_mode=mode)
+        with open(os.path.join(store_dir, "strings.json"), encoding="utf-8") as f: meta = json.load(f)
+        self.tags: List[str] = meta["tags"]
+        self.strings: List[str] = meta["strings"]
+
+    def __len__(self) -> int: return len(self.offsets) - 1
+
+    def move_codes(self, index: int) -> np.ndarray:
+        return self.moves[int(self.offsets[index]):int(self.offsets[index + 1])]
+
+    def moves_of(self, index: int) -> List[chess.Move]:
+        return [decode_move(int(code)) for code in self.move_codes(index)]
+
+    def headers(self, index: int) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        for tag, sid in zip(self.tags, self.header_table[index]):
+            if sid < 0: continue
+            if tag == EXTRA_TAGS: headers.update(json.loads(self.strings[sid]))
+            else: headers[tag] = self.strings[sid]
+        return headers
+
+    def start_fen(self, index: int) -> str:
+        sid = self.header_table[index][_FEN_COLUMN]
+        return self.strings[sid] if sid >= 0 else chess.STARTING_FEN
+
+    def board(self, index: int, ply: Optional[int] = None) -> chess.Board:
+        """The game's board after `ply` half-moves (default: final position), with its move stack."""
+        board = chess.Board(self.start_fen(index))
+        codes = self.move_codes(index)
+        for code in (codes if ply is None else codes[:ply]): board.push(decode_move(int(code)))
+        return board
+
+    def game(self, index: int) -> chess.pgn.Game:
+        game = chess.pgn.Game.from_board(self.board(index))
+        for tag, value in self.headers(index).items(): game.headers[tag] = value
+        return game
+
+    def to_pgn(self, index: int) -> str:
+        return str(self.game(index))
+
+    def __iter__(self) -> Iterator[chess.pgn.Game]:
+        for index in range(len(self)): yield self.game(index)
+
+def build_from_pgn(pgn_paths: Iterable[str], store_dir: str, logger=console_logger) -> int:
+    builder = GameStoreBuilder()
+    for path in pgn_paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while (game := chess.pgn.read_game(f)) is not None: builder.add_game(game)
+    builder.save(store_dir)
+    logger(f"Packed {len(builder)} games / {len(builder.moves)} moves into {store_dir}.", "user")
+    return len(builder)
+
+def export_pgn(store_dir: str, pgn_path: str) -> None:
+    store = GameStore(store_dir)
+    with open(pgn_path, "w", encoding="utf-8") as f:
+        for index in range(len(store)): f.write(store.to_pgn(index) + "\n\n")
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError: return float("nan") # Windows: no resource module
+
+def _bench_phase(kind: str, path: str) -> Dict[str, float]:
+    """
+    Loads the whole collection the way each format is used in memory (parsed Game objects vs
+    the packed arrays) and decodes every move once. Meant to run in a fresh process so peak RSS is per-format.
+    """
+    start = time.perf_counter()
+    if kind == "pgn":
+        games: List[chess.pgn.Game] = []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while (game := chess.pgn.read_game(f)) is not None: games.append(game)
+        count, moves = len(games), sum(1 for g in games for _ in g.mainline_moves())
+    else:
+        store = GameStore(path, mmap=False)
+        count, moves = len(store), sum(len(store.moves_of(i)) for i in range(len(store)))
+    return {"games": count, "moves": moves, "load_s": time.perf_counter() - start, "peak_rss_mb": _peak_rss_mb()}
+
+def benchmark(pgn_path: str, store_dir: str, logger=console_logger) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(os.path.join(store_dir, "moves.npy")): build_from_pgn([pgn_path], store_dir, logger)
+    results = {}
+    for kind, path in (("pgn", pgn_path), ("store", store_dir)):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "_bench_phase", kind, path],
+                             capture_output=True, text=True, check=True).stdout
+        results[kind] = json.loads(out.strip().splitlines()[-1])
+        r = results[kind]
+        logger(f"{kind:>5}: {r['games']} games loaded in {r['load_s']:.3f}s, peak RSS {r['peak_rss_mb']:.1f} MB", "user")
+    pgn_bytes = os.path.getsize(pgn_path)
+    store_bytes = sum(os.path.getsize(os.path.join(store_dir, n)) for n in os.listdir(store_dir))
+    logger(f"Size: PGN {pgn_bytes / 1e6:.2f} MB vs store {store_bytes / 1e6:.2f} MB; "
+           f"load speedup x{results['pgn']['load_s'] / max(results['store']['load_s'], 1e-9):.1f}", "user")
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "_bench_phase":
+        print(json.dumps(_bench_phase(sys.argv[2], sys.argv[3]))); sys.exit(0)
+    parser = argparse.ArgumentParser(description="Packed 16-bit game store for large game collections. Keeps every game's "
+                                                 "mainline and tags; comments, NAGs and variations are dropped.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_pack = sub.add_parser("pack", help="Convert PGN files into a store directory")
+    p_pack.add_argument("store_dir"); p_pack.add_argument("pgn", nargs="+")
+    p_export = sub.add_parser("export", help="Write a store back out as PGN")
+    p_export.add_argument("store_dir"); p_export.add_argument("pgn")
+    p_show = sub.add_parser("show", help="Print one game as PGN")
+    p_show.add_argument("store_dir"); p_show.add_argument("index", type=int)
+    p_bench = sub.add_parser("bench", help="Compare load time and RSS against PGN parsing")
+    p_bench.add_argument("pgn"); p_bench.add_argument("store_dir")
+    args = parser.parse_args()
+
+    if args.command == "pack": build_from_pgn(args.pgn, args.store_dir)
+    elif args.command == "export": export_pgn(args.store_dir, args.pgn)
+    elif args.command == "show": print(GameStore(args.store_dir).to_pgn(args.index))
+    else: benchmark(args.pgn, args.store_dir)
@@ -0,0 +1,199 @@
+import argparse
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import chess
+import chess.pgn
+
+from analysis_tree import AnalysisTree
+from chess_utils import console_logger, iter_pgn_games
+from engine_communication import ChessEngineCommunicator, parse_info_line
+from engine_pool import EnginePool, locate_engine, usable_cpus
+from prefetch_analysis import Prefetcher
+
+def format_score(score: Optional[int], is_mate: bool) -> str:
+    """'+0.35' / '-1.20' in pawns, '#3' / '#-2' for mates; side-to-move relative like the engine reports it."""
+    if score is None: return "?"
+    return f"#{score}" if is_mate else f"{score / 100.0:+.2f}"
+
+def pv_to_san(board: chess.Board, pv: List[str]) -> List[str]:
+    """SAN for as much of a UCI PV as is legal from `board` (engines occasionally send stale or truncated PVs)."""
+    board, san = board.copy(stack=False), []
+    for uci in pv:
+        try: move = chess.Move.from_uci(uci)
+        except ValueError: break
+        if move not in board.legal_moves: break
+        san.append(board.san(move)); board.push(move)
+    return san
+
+class InfiniteAnalysis:
+    """
+    Keeps one engine on 'go infinite' for the current position and passes every scored info line to
+    on_update (from a reader thread). set_position() sends 'stop', waits for the engine's bestmove and
+    starts on the new position without 'ucinewgame' or a restart, so the hash table carries over while
+    stepping through a game. Only the first search on a (re)started engine sends 'ucinewgame'.
+    With an AnalysisTree, a stored result is reported (marked 'cached') before the search starts and
+    the main line is written back to the tree whenever a search is stopped.
+    """
+    def __init__(self, engine: ChessEngineCommunicator, on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 multipv: int = 1, tree: Optional[AnalysisTree] = None, logger: Callable[[str, str], None] = console_logger):
+        self.engine: ChessEngineCommunicator = engine
+        self.on_update: Optional[Callable[[Dict[str, Any]], None]] = on_update
+        self.multipv: int = multipv
+        self.tree: Optional[AnalysisTree] = tree
+        self.logger: Callable[[str, str], None] = logger
+        self.board: Optional[chess.Board] = None
+        self.lines: Dict[int, Dict[str, Any]] = {} # multipv -> latest info for the current position
+        self.bestmove: Optional[str] = None # bestmove the engine gave when the last search was stopped
+        self._lock = threading.Lock() # serializes position changes; the reader thread owns stdout while searching
+        self._reader: Optional[threading.Thread] = None
+        self._process = None # engine process the hash belongs to
+
+    @property
+    def searching(self) -> bool:
+        return self._reader is not None and self._reader.is_alive()
+
+    def set_position(self, position: Union[str, chess.Board]) -> bool:
+        """Switches the search to a FEN or board (a board's move stack is sent too, for repetition detection)."""
+        board = chess.Board(position) if isinstance(position, str) else position.copy()
+        with self._lock:
+            self._stop_search()
+            self.board, self.lines, self.bestmove = board, {}, None
+            if self.tree is not None: self._from_tree(board)
+            if board.is_game_over(): return False
+            root = board.root()
+            new_game = self.engine.engine_process is None or self.engine.engine_process is not self._process
+            if not self.engine.start_infinite(root.fen(), [m.uci() for m in board.move_stack], self.multipv, new_game=new_game):
+                return False
+            self._process = self.engine.engine_process
+            self._reader = threading.Thread(target=self._read_loop, args=(board, time.time(), self._process), name="infinite-analysis", daemon=True)
+            self._reader.start()
+        return True
+
+    def stop(self) -> Optional[str]:
+        """Stops the search and returns the engine's bestmove; the engine stays up with its hash intact."""
+        with self._lock: self._stop_search()
+        return self.bestmove
+
+    def _stop_search(self, timeout_s: float = 10.0) -> None:
+        if not self.searching: return
+        self.engine.send_command("stop")
+        self._reader.join(timeout_s)
+        if self._reader.is_alive(): # engine ignored 'stop': kill it so the reader hits EOF, and restart only once the reader is gone
+            self.logger("Engine did not answer 'stop'; restarting it.", "debug")
+            try: self._process.kill()
+            except OSError: pass
+            self._reader.join(timeout_s)
+            if self._reader.is_alive(): self.logger("Infinite-analysis reader did not exit after killing the engine.", "user")
+            self.engine.restart_engine()
+        self._reader = None
+        if self.tree is not None and (main := self.lines.get(1)) and "bound" not in main:
+            self.tree.put(self.board, {**main, "bestmove": self.bestmove or (main.get("pv") or [None])[0]})
+
+    def _from_tree(self, board: chess.Board) -> None:
+        if board.move_stack:
+            parent = board.copy(); move = parent.pop(); self.tree.add_move(parent, move)
+        if (node := self.tree.get(board)) is None: return
+        info = {**node, "multipv": 1, "elapsed": 0.0, "fen": board.fen(), "pv_san": pv_to_san(board, node["pv"]), "cached": True}
+        self.lines[1] = info
+        if self.on_update: self.on_update(info)
+
+    def _read_loop(self, board: chess.Board, start_time: float, process) -> None:
+        fen = board.fen()
+        while self.engine.engine_process is process and (output := self.engine.read_output_line()) is not None:
+            if output.startswith("bestmove"):
+                parts = output.split()
+                self.bestmove = parts[1] if len(parts) > 1 else None
+                return
+            if not output.startswith("info"): continue
+            info = parse_info_line(output)
+            if info is None or "score" not in info: continue
+            info["elapsed"] = time.time() - start_time
+            info["fen"] = fen
+            info["pv_san"] = pv_to_san(board, info.get("pv", []))
+            self.lines[info.get("multipv", 1)] = info
+            if self.on_update: self.on_update(info)
+        self.logger("Engine exited during infinite analysis.", "user")
+
+def _print_update(info: Dict[str, Any], multipv: int, printed: Dict[int, int]) -> None:
+    # One line per completed depth of each PV line, instead of every intermediate info.
+    line = info.get("multipv", 1)
+    if printed.get(line) == info.get("depth") and "bound" not in info: return
+    printed[line] = info.get("depth", 0)
+    prefix = ("[tree] " if info.get("cached") else "") + (f"[{line}] " if multipv > 1 else "")
+    print(f"{prefix}depth {info.get('depth', 0)}/{info.get('seldepth', 0)} {format_score(info['score'], info['mate'])}"
+          f" nodes {info.get('nodes', 0)} nps {info.get('nps', 0)} {info['elapsed']:.1f}s  {' '.join(info['pv_san'])}", flush=True)
+
+def _describe(board: chess.Board, ply: Optional[int] = None) -> str:
+    last = ""
+    if board.move_stack:
+        move = board.pop(); last = f" after {board.fullmove_number}{'.' if board.turn == chess.WHITE else '...'} {board.san(move)}"; board.push(move)
+    where = f"ply {ply}" if ply is not None else "position"
+    return f"--- {where}{last}: {board.fen()}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuous 'go infinite' analysis of a FEN or a PGN game.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--fen", default=None, help="Position to analyse (default: start position)")
+    source.add_argument("--pgn", default=None, help="PGN file; step through the game with n/p/g")
+    parser.add_argument("--game", type=int, default=1, help="Game number in the PGN file (1-based)")
+    parser.add_argument("--ply", type=int, default=0, help="Ply of the game to start at")
+    parser.add_argument("--engine", default=None); parser.add_argument("--multipv", type=int, default=1)
+    parser.add_argument("--hash", type=int, default=256); parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--tree", default=None, help="AnalysisTree directory to reuse and extend (saved on quit)")
+    parser.add_argument("--prefetch", type=int, default=0, help="Extra engines that analyse the next plies of a PGN ahead of time")
+    parser.add_argument("--prefetch-depth", type=int, default=18)
+    args = parser.parse_args()
+
+    engine_path = args.engine or locate_engine()
+    if not engine_path: parser.error("Engine not found; pass --engine.")
+    moves: List[chess.Move] = []
+    start_board = chess.Board(args.fen) if args.fen else chess.Board()
+    if args.pgn:
+        game = next((g for i, g in enumerate(iter_pgn_games(args.pgn), 1) if i == args.game), None)
+        if game is None: parser.error(f"{args.pgn} has no game {args.game}.")
+        start_board, moves = game.board(), list(game.mainline_moves())
+    ply = max(0, min(args.ply, len(moves)))
+
+    def board_at(target_ply: int) -> chess.Board:
+        board = start_board.copy()
+        for move in moves[:target_ply]: board.push(move)
+        return board
+
+    printed: Dict[int, int] = {}
+    engine = ChessEngineCommunicator(engine_path, console_logger, options={"Hash": args.hash, "Threads": args.threads})
+    tree = AnalysisTree(args.tree) if args.tree or args.prefetch else None
+    spare_cpus = usable_cpus()[args.threads:] # the prefetch engines stay off the cores the main engine needs
+    prefetch_pool = EnginePool(engine_path, console_logger, size=args.prefetch, cpus=spare_cpus) if args.prefetch and moves else None
+    prefetcher = Prefetcher(prefetch_pool, tree, depth=args.prefetch_depth) if prefetch_pool else None
+    session = InfiniteAnalysis(engine, lambda info: _print_update(info, args.multipv, printed), multipv=args.multipv, tree=tree)
+    console_logger("Commands: n/Enter next, p previous, g <ply> go to ply, f <fen> new position, s stop, q quit.", "user")
+
+    def show(board: chess.Board, at_ply: Optional[int]) -> None:
+        printed.clear()
+        console_logger(_describe(board, at_ply), "user")
+        if not session.set_position(board): console_logger(f"Nothing to analyse ({board.result(claim_draw=True)}).", "user")
+        if prefetcher is not None:
+            if at_ply is None: prefetcher.cancel()
+            else: prefetcher.focus([board_at(i) for i in range(len(moves) + 1)], at_ply)
+
+    show(board_at(ply), ply if moves else None)
+    try:
+        for command in sys.stdin:
+            cmd, _, arg = command.strip().partition(" ")
+            if cmd in ("", "n") and ply < len(moves): ply += 1; show(board_at(ply), ply)
+            elif cmd == "p" and ply > 0: ply -= 1; show(board_at(ply), ply)
+            elif cmd == "g" and arg.isdigit(): ply = min(int(arg), len(moves)); show(board_at(ply), ply)
+            elif cmd == "f" and arg:
+                try: start_board, moves, ply = chess.Board(arg), [], 0
+                except ValueError as e: console_logger(f"Invalid FEN: {e}", "user"); continue
+                show(start_board, None)
+            elif cmd == "s": console_logger(f"Stopped; bestmove {session.stop()}.", "user")
+            elif cmd == "q": break
+    except KeyboardInterrupt: pass
+    finally:
+        session.stop(); engine.stop_engine()
+        if prefetcher is not None: prefetcher.close(); prefetch_pool.close()
+        if args.tree: tree.save()
@@ -0,0 +1,119 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import METRICS_ENABLED, METRICS_HTTP_PORT, METRICS_JSON_PATH, METRICS_JSON_INTERVAL_S
+
+# Metrics are off unless enabled; every hook below then costs one global check and returns.
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+NPS_BUCKETS: Tuple[float, ...] = (1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+
+_enabled: bool = False
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_histograms: Dict[str, "Histogram"] = {}
+_NULL_SPAN = nullcontext()
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1) # last slot is +Inf
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value; self.count += 1
+
+class _Span:
+    __slots__ = ("name", "start")
+    def __init__(self, name: str): self.name = name
+
+    def __enter__(self): self.start = time.perf_counter(); return self
+
+    def __exit__(self, *exc):
+        observe(f"{self.name}_seconds", time.perf_counter() - self.start, LATENCY_BUCKETS)
+        return False
+
+def enable() -> None:
+    global _enabled; _enabled = True
+
+def disable() -> None:
+    global _enabled; _enabled = False
+
+def is_enabled() -> bool: return _enabled
+
+def span(name: str):
+    """Context manager timing a block into the `<name>_seconds` histogram."""
+    return _Span(name) if _enabled else _NULL_SPAN
+
+def count(name: str, value: float = 1) -> None:
+    if not _enabled: return
+    with _lock: _counters[name] = _counters.get(name, 0) + value
+
+def observe(name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+    if not _enabled: return
+    with _lock:
+        if (hist := _histograms.get(name)) is None: hist = _histograms[name] = Histogram(buckets)
+        hist.observe(value)
+
+def reset() -> None:
+    with _lock: _counters.clear(); _histograms.clear()
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "timestamp": time.time(), "counters": dict(_counters),
+            "histograms": {name: {"buckets": list(h.buckets), "counts": list(h.counts), "sum": h.sum, "count": h.count}
+                           for name, h in _histograms.items()},
+        }
+
+def render_prometheus(prefix: str = "chess_bot_") -> str:
+    """Current metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            lines += [f"# TYPE {prefix}{name} counter", f"{prefix}{name} {value:g}"]
+        for name, hist in sorted(_histograms.items()):
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            cumulative = 0
+            for bound, n in zip(list(hist.buckets) + [float("inf")], hist.counts):
+                cumulative += n
+                lines.append(f'{prefix}{name}_bucket{{le="{"+Inf" if bound == float("inf") else f"{bound:g}"}"}} {cumulative}')
+            lines += [f"{prefix}{name}_sum {hist.sum:g}", f"{prefix}{name}_count {hist.count}"]
+    return "\n".join(lines) + "\n"
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves /metrics for a Prometheus scraper on a background thread."""
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"): self.send_error(404); return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4"); self.send_header("Content-Length", str(len(body)))
+            self.end_headers(); self.wfile.write(body)
+        def log_message(self, *args): pass
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_json_dump(path: str, interval_s: float = 10.0) -> threading.Event:
+    """Rewrites `path` with a snapshot() every interval_s seconds until the returned event is set."""
+    stop = threading.Event()
+    def _loop():
+        while not stop.wait(interval_s):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f: json.dump(snapshot(), f)
+            os.replace(tmp_path, path)
+    threading.Thread(target=_loop, daemon=True).start()
+    return stop
+
+if METRICS_ENABLED:
+    enable()
+    if METRICS_HTTP_PORT: start_http_server(METRICS_HTTP_PORT)
+    if METRICS_JSON_PATH: start_json_dump(METRICS_JSON_PATH, METRICS_JSON_INTERVAL_S)
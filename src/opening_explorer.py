@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from chess_utils import console_logger, iter_pgn_games_with_offsets
+from engine_pool import usable_cpus
+from game_store import decode_move, encode_move
+
+# Move rows are grouped by position; an open-addressed table maps a Zobrist key to its rows in one or two probes.
+SLOT_DTYPE = np.dtype([("key", "<u8"), ("start", "<u4"), ("count", "<u4")]) # count 0 = empty slot
+MOVE_DTYPE = np.dtype([("move", "<u2"), ("white", "<u4"), ("draws", "<u4"), ("black", "<u4")])
+ROW_DTYPE = np.dtype([("key", "<u8"), ("move", "<u2"), ("white", "<u4"), ("draws", "<u4"), ("black", "<u4")]) # aggregation only
+MANIFEST_NAME = "explorer.json"
+MAX_PLY = 40               # only the opening is tabulated; deeper positions are almost all unique
+CHUNK_BYTES = 32 << 20     # PGN bytes per aggregation task, so one big archive is still split across workers
+LOAD_FACTOR = 0.5          # at most half the slots are used; keeps probe sequences to a slot or two
+RESULT_COLUMNS = {"1-0": 0, "1/2-1/2": 1, "0-1": 2}
+
+def _next_game_start(f, pos: int, end: int) -> int:
+    """Byte offset of the first '[Event ' tag line at or after pos (or end), i.e. a game boundary."""
+    if pos == 0: return 0
+    f.seek(pos - 1); buffered = b""
+    while pos < end:
+        block = f.read(1 << 16)
+        if not block: return end
+        found = (buffered + block).find(b"\n[Event ")
+        if found >= 0: return min(end, pos - 1 - len(buffered) + found + 1)
+        buffered = block[-8:]; pos += len(block)
+    return end
+
+def split_pgn(path: str, start: int, end: int, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """Cuts [start, end) of a PGN file into byte ranges of about chunk_bytes that begin on game boundaries."""
+    bounds, chunk_bytes = [start], max(chunk_bytes, 1 << 16)
+    with open(path, "rb") as f:
+        for pos in range(start + chunk_bytes, end, chunk_bytes):
+            cut = _next_game_start(f, pos, end)
+            if cut > bounds[-1] and cut < end: bounds.append(cut)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def aggregate_range(path: str, start: int, end: int, max_ply: int = MAX_PLY) -> Tuple[np.ndarray, int, int]:
+    """
+    Counts (position, move) -> white wins / draws / black wins for the games that start in [start, end).
+    A position is counted once per game even if the game repeats it. Games without a decisive or drawn
+    result are skipped. Returns (ROW_DTYPE rows sorted by key and move, games counted, games skipped).
+    """
+    counts: Dict[Tuple[int, int], List[int]] = {}
+    games = skipped = 0
+    for offset, _end, game in iter_pgn_games_with_offsets(path, start):
+        if offset >= end: break
+        column = RESULT_COLUMNS.get(game.headers.get("Result", "*"))
+        if column is None: skipped += 1; continue
+        board, seen = game.board(), set()
+        for ply, move in enumerate(game.mainline_moves()):
+            if ply >= max_ply: break
+            key = chess.polyglot.zobrist_hash(board)
+            if key not in seen:
+                seen.add(key)
+                row = counts.get((key, encode_move(move)))
+                if row is None: row = counts[(key, encode_move(move))] = [0, 0, 0]
+                row[column] += 1
+            board.push(move)
+        games += 1
+    rows = np.empty(len(counts), dtype=ROW_DTYPE)
+    if counts:
+        keys, values = zip(*counts.items())
+        rows["key"], rows["move"] = np.array(keys, dtype=np.uint64).T
+        rows["white"], rows["draws"], rows["black"] = np.array(values, dtype=np.uint32).T
+    return merge_rows([rows]), games, skipped
+
+def merge_rows(parts: List[np.ndarray]) -> np.ndarray:
+    """Concatenates ROW_DTYPE arrays and sums the counts of equal (key, move) pairs; the result is sorted."""
+    rows = np.concatenate(parts) if parts else np.zeros(0, dtype=ROW_DTYPE)
+    if not len(rows): return rows
+    rows = rows[np.lexsort((rows["move"], rows["key"]))]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows["key"][1:] != rows["key"][:-1]) | (rows["move"][1:] != rows["move"][:-1])
+    starts = np.flatnonzero(first)
+    merged = rows[starts].copy()
+    for column in ("white", "draws", "black"): merged[column] = np.add.reduceat(rows[column], starts)
+    return merged
+
+def build_slots(keys: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Open-addressed (linear probing) table for distinct position keys, built vectorized: every round,
+    each unplaced key tries its next slot and the first claimant of each free slot takes it.
+    """
+    size = 1 << max(4, int(np.ceil(np.log2(max(1, len(keys)) / LOAD_FACTOR))))
+    slots = np.zeros(size, dtype=SLOT_DTYPE)
+    pending = np.arange(len(keys))
+    probe = 0
+    while len(pending):
+        target = (keys[pending] + np.uint64(probe)) & np.uint64(size - 1)
+        free = slots["count"][target.astype(np.int64)] == 0
+        uniq, first = np.unique(target[free], return_index=True)
+        placed = pending[free][first]
+        uniq = uniq.astype(np.int64)
+        slots["key"][uniq], slots["start"][uniq], slots["count"][uniq] = keys[placed], starts[placed], counts[placed]
+        placed_mask = np.zeros(len(keys), dtype=bool); placed_mask[placed] = True
+        pending = pending[~placed_mask[pending]]
+        probe += 1
+    return slots
+
+class OpeningExplorer:
+    """
+    Move frequencies and game results per position, aggregated from PGN archives.
+    On disk: a move table (one row per position and move, grouped by position) and a hash table of
+    slots keyed by Zobrist hash that points into it, both memory-mapped, so a query costs a probe or
+    two regardless of the table size. add() aggregates new archives (or games appended to known ones)
+    in worker processes and merges them into the next generation; the manifest is replaced last.
+    """
+    def __init__(self, explorer_dir: str, logger: Callable[[str, str], None] = console_logger):
+        self.explorer_dir: str = explorer_dir
+        self.logger: Callable[[str, str], None] = logger
+        self.manifest: Dict[str, Any] = {"generation": 0, "max_ply": MAX_PLY, "files": [], "games": 0, "positions": 0, "moves": 0}
+        self._slots = np.zeros(16, dtype=SLOT_DTYPE)
+        self._moves = np.zeros(0, dtype=MOVE_DTYPE)
+        manifest_path = os.path.join(explorer_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f: self.manifest = json.load(f)
+            if self.manifest["positions"]:
+                self._slots = np.load(self._path("slots"), mmap_mode="r")
+                self._moves = np.load(self._path("moves"), mmap_mode="r")
+
+    def _path(self, name: str, generation: Optional[int] = None) -> str:
+        generation = self.manifest["generation"] if generation is None else generation
+        return os.path.join(self.explorer_dir, f"{name}-{generation:06d}.npy")
+
+    def _rows(self) -> np.ndarray:
+        """The saved table expanded back to ROW_DTYPE rows, for merging."""
+        used = np.asarray(self._slots[self._slots["count"] > 0])
+        used = used[np.argsort(used["start"])]
+        rows = np.empty(len(self._moves), dtype=ROW_DTYPE)
+        rows["key"] = np.repeat(used["key"], used["count"])
+        for column in MOVE_DTYPE.names: rows[column] = self._moves[column]
+        return rows
+
+    def add(self, pgn_paths: List[str], workers: Optional[int] = None, chunk_bytes: int = CHUNK_BYTES) -> int:
+        """Aggregates games not yet in the explorer from these PGN files and merges them in. Returns the games added."""
+        files = {entry["path"]: entry for entry in self.manifest["files"]}
+        tasks, sizes = [], {}
+        for path in pgn_paths:
+            abs_path = os.path.abspath(path)
+            entry = files.get(abs_path) or {"path": abs_path, "indexed_bytes": 0, "games": 0}
+            sizes[abs_path] = os.path.getsize(abs_path)
+            if sizes[abs_path] <= entry["indexed_bytes"]: self.logger(f"{path}: up to date.", "debug"); continue
+            files[abs_path] = entry
+            tasks += [(abs_path, start, end) for start, end in split_pgn(abs_path, entry["indexed_bytes"], sizes[abs_path], chunk_bytes)]
+        if not tasks: return 0
+        workers = max(1, min(workers or len(usable_cpus()), len(tasks)))
+        start_time = time.time()
+        parts, games, skipped = [], 0, 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(path, executor.submit(aggregate_range, path, start, end, self.manifest["max_ply"])) for path, start, end in tasks]
+            for path, future in futures:
+                rows, task_games, task_skipped = future.result()
+                parts.append(rows); games += task_games; skipped += task_skipped; files[path]["games"] += task_games
+        aggregated = time.time() - start_time
+        rows = merge_rows([self._rows()] + parts)
+        for path in {path for path, _start, _end in tasks}: files[path]["indexed_bytes"] = sizes[path]
+        self._save(rows, list(files.values()), self.manifest["games"] + games)
+        self.logger(f"Added {games} games ({skipped} without result skipped) from {len(tasks)} chunk(s) on {workers} worker(s): "
+                    f"aggregated in {aggregated:.1f}s ({games / max(aggregated, 1e-9):.0f} games/s), "
+                    f"{self.manifest['positions']} positions / {self.manifest['moves']} moves after merge.", "user")
+        return games
+
+    def _save(self, rows: np.ndarray, files: List[Dict[str, Any]], games: int) -> None:
+        os.makedirs(self.explorer_dir, exist_ok=True)
+        old_generation = self.manifest["generation"] if self.manifest["positions"] else None
+        new_position = np.ones(len(rows), dtype=bool)
+        if len(rows): new_position[1:] = rows["key"][1:] != rows["key"][:-1]
+        starts = np.flatnonzero(new_position)
+        counts = np.diff(np.append(starts, len(rows)))
+        slots = build_slots(rows["key"][starts], starts.astype(np.uint32), counts.astype(np.uint32))
+        moves = np.empty(len(rows), dtype=MOVE_DTYPE)
+        for column in MOVE_DTYPE.names: moves[column] = rows[column]
+        generation = self.manifest["generation"] + 1
+        np.save(self._path("slots", generation), slots); np.save(self._path("moves", generation), moves)
+        self.manifest = {**self.manifest, "generation": generation, "files": files, "games": games,
+                         "positions": len(starts), "moves": len(rows)}
+        tmp_path = os.path.join(self.explorer_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f: json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.explorer_dir, MANIFEST_NAME))
+        self._slots, self._moves = np.load(self._path("slots"), mmap_mode="r"), np.load(self._path("moves"), mmap_mode="r")
+        if old_generation is not None:
+            for name in ("slots", "moves"):
+                try: os.remove(self._path(name, old_generation))
+                except OSError: pass # still mapped on Windows; a later generation's save does not need it
+
+    def lookup_hash(self, key: int) -> List[Dict[str, int]]:
+        """(move code, white, draws, black) rows for a Zobrist key, most played first; empty if never reached."""
+        mask = len(self._slots) - 1
+        slot = key & mask
+        while True:
+            entry = self._slots[slot]
+            if entry["count"] == 0: return []
+            if int(entry["key"]) == key: break
+            slot = (slot + 1) & mask
+        rows = self._moves[int(entry["start"]):int(entry["start"]) + int(entry["count"])]
+        stats = [{"move": int(r["move"]), "white": int(r["white"]), "draws": int(r["draws"]), "black": int(r["black"])} for r in rows]
+        return sorted(stats, key=lambda s: -(s["white"] + s["draws"] + s["black"]))
+
+    def query(self, board_or_fen) -> List[Dict[str, Any]]:
+        """Moves played from a position with their game count, W/D/L counts and white's score, most played first."""
+        board = chess.Board(board_or_fen) if isinstance(board_or_fen, str) else board_or_fen
+        result = []
+        for stats in self.lookup_hash(chess.polyglot.zobrist_hash(board)):
+            move = decode_move(stats["move"])
+            games = stats["white"] + stats["draws"] + stats["black"]
+            result.append({"uci": move.uci(), "san": board.san(move) if move in board.legal_moves else move.uci(), "games": games,
+                           "white": stats["white"], "draws": stats["draws"], "black": stats["black"],
+                           "score": (stats["white"] + 0.5 * stats["draws"]) / games})
+        return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Opening explorer: move frequencies and results per position from PGN archives.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_add = sub.add_parser("add", help="Aggregate new PGN files / newly appended games into the explorer")
+    p_add.add_argument("explorer_dir"); p_add.add_argument("pgn", nargs="+")
+    p_add.add_argument("--workers", type=int, default=None, help="Aggregation processes (default: usable CPUs)")
+    p_add.add_argument("--max-ply", type=int, default=None, help=f"Plies tabulated per game (default {MAX_PLY}; fixed once created)")
+    p_add.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES >> 20)
+    p_query = sub.add_parser("query", help="Moves played from a position")
+    p_query.add_argument("explorer_dir"); p_query.add_argument("fen", nargs="?", default=chess.STARTING_FEN)
+    p_query.add_argument("--moves", default="", help="UCI moves to play from the FEN first")
+    p_info = sub.add_parser("info"); p_info.add_argument("explorer_dir")
+    args = parser.parse_args()
+
+    explorer = OpeningExplorer(args.explorer_dir)
+    if args.command == "add":
+        if args.max_ply is not None:
+            if explorer.manifest["positions"] and args.max_ply != explorer.manifest["max_ply"]:
+                parser.error(f"Explorer was built with --max-ply {explorer.manifest['max_ply']}.")
+            explorer.manifest["max_ply"] = args.max_ply
+        explorer.add(args.pgn, args.workers, args.chunk_mb << 20)
+    elif args.command == "query":
+        board = chess.Board(args.fen)
+        for uci in args.moves.split(): board.push_uci(uci)
+        start = time.perf_counter()
+        rows = explorer.query(board)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        total = sum(row["games"] for row in rows)
+        console_logger(f"{board.fen()}: {total} games, {len(rows)} moves ({elapsed_ms:.2f}ms)", "user")
+        for row in rows:
+            console_logger(f"{row['san']:<8} {row['games']:>8} {row['games'] / total:>6.1%}   "
+                           f"+{row['white']} ={row['draws']} -{row['black']}   score {row['score']:.1%}", "user")
+    else:
+        m = explorer.manifest
+        console_logger(f"generation {m['generation']}, {m['games']} games, {m['positions']} positions, {m['moves']} moves, "
+                       f"max ply {m['max_ply']}, {len(m['files'])} files", "user")
@@ -0,0 +1,185 @@
+import argparse
+import collections
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from chess_utils import console_logger
+from engine_pool import usable_cpus
+
+CHUNK_BYTES = 16 << 20      # input bytes per worker task
+DEFAULT_CAPACITY = 50_000_000 # distinct positions the dedup filter is sized for
+DEFAULT_FP_RATE = 1e-4      # chance a new position is wrongly dropped as a duplicate at full capacity
+COUNTER_OPCODES = ("hmvc", "fmvn") # move counters are not part of a position's identity
+
+class BloomFilter:
+    """
+    Fixed-size bit array answering "seen before?" for 64-bit Zobrist keys; memory does not grow with
+    the input. No false negatives; false positives (a new position reported as seen) at about fp_rate
+    once `capacity` keys are in. The k probe positions come from the key's two 32-bit halves (double hashing).
+    """
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, fp_rate: float = DEFAULT_FP_RATE):
+        self.bits: int = max(64, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes: int = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+        self.added: int = 0
+
+    @property
+    def size_mb(self) -> float:
+        return self._array.nbytes / 2**20
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        low, high = keys & np.uint64(0xFFFFFFFF), (keys >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        return (low[:, None] + steps[None, :] * high[:, None]) % np.uint64(self.bits)
+
+    def add_new(self, keys: np.ndarray) -> np.ndarray:
+        """Mask of the (distinct) keys that were not in the filter yet; those are added."""
+        positions = self._positions(keys)
+        present = (self._array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        new = ~present.all(axis=1)
+        fresh = positions[new].ravel()
+        np.bitwise_or.at(self._array, fresh >> np.uint64(3), (1 << (fresh & np.uint64(7))).astype(np.uint8))
+        self.added += int(new.sum())
+        return new
+
+    def false_positive_rate(self) -> float:
+        """Current chance that an unseen key tests as present, from the number of keys added."""
+        return (1 - math.exp(-self.hashes * self.added / self.bits)) ** self.hashes
+
+def normalize_line(line: str) -> Tuple[Optional[chess.Board], Dict[str, Any], str]:
+    """
+    Parses a FEN or EPD line and normalizes the position: castling rights the placement cannot have
+    are dropped and an en passant square that is impossible or has no legal en passant capture is cleared.
+    Returns (board or None, EPD opcodes, '' / 'normalized' / the rejection reason).
+    """
+    fields = line.split()
+    try:
+        if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit() and ";" not in line:
+            board, ops = chess.Board(" ".join(fields[:6])), {}
+        else: board, ops = chess.Board.from_epd(line)
+    except ValueError: return None, {}, "unparsable"
+    changed = False
+    if (castling := board.clean_castling_rights()) != board.castling_rights: board.castling_rights = castling; changed = True
+    if board.ep_square is not None and (board.status() & chess.STATUS_INVALID_EP_SQUARE or not board.has_legal_en_passant()):
+        board.ep_square = None; changed = True
+    status = board.status()
+    if status != chess.STATUS_VALID: return None, ops, "+".join(s.name.lower() for s in chess.Status if s and status & s)
+    for op in COUNTER_OPCODES: ops.pop(op, None)
+    return board, ops, "normalized" if changed else ""
+
+def clean_range(path: str, start: int, end: int, output_format: str = "epd") -> Dict[str, Any]:
+    """
+    Validates and normalizes the lines of [start, end) of a position file (ranges start on a line).
+    Returns the Zobrist keys and output lines of the valid positions in input order, rejected lines
+    with their reasons, and counts.
+    """
+    with open(path, "rb") as f:
+        f.seek(start); data = f.read(end - start)
+    keys, lines, rejects = [], [], []
+    counts: Dict[str, int] = collections.Counter()
+    for raw in data.decode("utf-8", errors="replace").splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"): counts["skipped"] += 1; continue
+        board, ops, reason = normalize_line(line)
+        if board is None: rejects.append((reason, line)); counts["rejected"] += 1; continue
+        if reason: counts[reason] += 1
+        try: text = board.epd(**ops) if output_format == "epd" else board.fen()
+        except (ValueError, TypeError): text = board.epd() # opcodes python-chess cannot write back are dropped
+        keys.append(chess.polyglot.zobrist_hash(board)); lines.append(text)
+    return {"keys": np.array(keys, dtype=np.uint64), "lines": lines, "rejects": rejects, "counts": counts, "bytes": end - start}
+
+def split_lines(path: str, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """Cuts a text file into byte ranges of about chunk_bytes that end after a newline."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        while bounds[-1] + chunk_bytes < size:
+            f.seek(bounds[-1] + chunk_bytes); f.readline()
+            if f.tell() >= size: break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def clean_positions(paths: List[str], out: TextIO, rejects_out: Optional[TextIO] = None, dropped_out: Optional[TextIO] = None,
+                    output_format: str = "epd",
+                    capacity: int = DEFAULT_CAPACITY, fp_rate: float = DEFAULT_FP_RATE, workers: Optional[int] = None,
+                    chunk_bytes: int = CHUNK_BYTES, logger: Callable[[str, str], None] = console_logger) -> Dict[str, Any]:
+    """
+    Streams position files through a process pool in chunks and writes each distinct valid position
+    once, in input order (the first occurrence wins). At most 2 chunks per worker are in flight, and the
+    dedup filter has a fixed size, so memory stays flat however large the input is. Dedup is
+    probabilistic: a filter false positive drops a distinct position as a duplicate, so every dropped
+    line can be written to `dropped_out` for checking.
+    """
+    tasks = [(path, start, end) for path in paths for start, end in split_lines(path, chunk_bytes)]
+    total_bytes = sum(end - start for _path, start, end in tasks)
+    workers = max(1, min(workers or len(usable_cpus()), len(tasks) or 1))
+    seen = BloomFilter(capacity, fp_rate)
+    logger(f"{len(tasks)} chunk(s) of {total_bytes / 2**20:.0f} MB on {workers} worker(s); "
+           f"dedup filter {seen.size_mb:.0f} MB for {capacity} positions.", "user")
+    stats: Dict[str, int] = collections.Counter()
+    start_time, last_report, done_bytes = time.time(), time.time(), 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: "collections.deque" = collections.deque()
+        task_iter = iter(tasks)
+        def _submit() -> None:
+            for path, start, end in task_iter:
+                pending.append(executor.submit(clean_range, path, start, end, output_format))
+                if len(pending) >= 2 * workers: return
+        _submit()
+        while pending:
+            chunk = pending.popleft().result(); _submit()
+            stats.update(chunk["counts"]); done_bytes += chunk["bytes"]
+            keys = chunk["keys"]
+            _uniq, first = np.unique(keys, return_index=True) # duplicates inside the chunk: keep the first
+            first.sort()
+            new = first[seen.add_new(keys[first])]
+            stats["valid"] += len(keys); stats["duplicates"] += len(keys) - len(new); stats["written"] += len(new)
+            out.writelines(chunk["lines"][i] + "\n" for i in new)
+            if dropped_out is not None: dropped_out.writelines(chunk["lines"][i] + "\n" for i in np.setdiff1d(np.arange(len(keys)), new))
+            if rejects_out is not None: rejects_out.writelines(f"{reason}\t{line}\n" for reason, line in chunk["rejects"])
+            if time.time() - last_report >= 10:
+                last_report = time.time(); elapsed = last_report - start_time
+                logger(f"{done_bytes / 2**20:.0f}/{total_bytes / 2**20:.0f} MB, {stats['valid'] + stats['rejected']} positions "
+                       f"({(stats['valid'] + stats['rejected']) / elapsed:.0f}/s, {done_bytes / 2**20 / elapsed:.1f} MB/s), "
+                       f"{stats['written']} written.", "user")
+    elapsed = max(time.time() - start_time, 1e-9)
+    report = {**stats, "elapsed_s": elapsed, "positions_per_s": (stats["valid"] + stats["rejected"]) / elapsed,
+              "mb_per_s": total_bytes / 2**20 / elapsed, "filter_fp_rate": seen.false_positive_rate()}
+    logger(f"Done in {elapsed:.1f}s ({report['positions_per_s']:.0f} positions/s, {report['mb_per_s']:.1f} MB/s): "
+           f"{stats['valid'] + stats['rejected']} positions, {stats['rejected']} rejected, {stats['normalized']} normalized, "
+           f"{stats['duplicates']} duplicates, {stats['written']} written. "
+           f"Dedup filter false-positive rate now {report['filter_fp_rate']:.2e}.", "user")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate, normalize and deduplicate FEN/EPD position files. Dedup uses a "
+                                                 "fixed-size Bloom filter, so it is probabilistic: about --fp-rate of distinct positions "
+                                                 "may be dropped as duplicates once --capacity positions are in (see --dropped).")
+    parser.add_argument("inputs", nargs="+", help="FEN or EPD files, one position per line")
+    parser.add_argument("-o", "--out", required=True, help="Output file of distinct valid positions")
+    parser.add_argument("--format", choices=("epd", "fen"), default="epd",
+                        help="epd keeps the opcodes (minus move counters); fen writes plain FENs")
+    parser.add_argument("--rejects", default=None, help="Write rejected lines here, tab-prefixed with the reason")
+    parser.add_argument("--dropped", default=None, help="Write every line dropped as a duplicate here, to check for filter false positives")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="Expected distinct positions (sizes the dedup filter)")
+    parser.add_argument("--fp-rate", type=float, default=DEFAULT_FP_RATE, help="Dedup filter false-positive rate at capacity")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: usable CPUs)")
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES >> 20)
+    args = parser.parse_args()
+
+    with open(args.out, "w", encoding="utf-8") as out_file:
+        rejects_file = open(args.rejects, "w", encoding="utf-8") if args.rejects else None
+        dropped_file = open(args.dropped, "w", encoding="utf-8") if args.dropped else None
+        try: clean_positions(args.inputs, out_file, rejects_file, dropped_file, args.format, args.capacity, args.fp_rate, args.workers,
+                             max(1, args.chunk_mb) << 20)
+        finally:
+            for f in (rejects_file, dropped_file):
+                if f: f.close()
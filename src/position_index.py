@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import chess
+import chess.pgn
+import chess.polyglot
+import numpy as np
+
+from chess_utils import console_logger, iter_pgn_games_with_offsets
+
+# One record per (position, game). Segments are sorted by key so lookups are a binary search on the mmap.
+RECORD_DTYPE = np.dtype([("key", "<u8"), ("file", "<u4"), ("ply", "<u4"), ("offset", "<u8")])
+MANIFEST_NAME = "manifest.json"
+
+def iter_pgn_positions(path: str, start_offset: int = 0) -> Iterator[Tuple[int, Optional[chess.pgn.Game], List[int]]]:
+    """
+    Streams games from a PGN file starting at a byte offset.
+    Yields (game_offset, game, zobrist keys of every position from the start position onward).
+    """
+    for offset, _end, game in iter_pgn_games_with_offsets(path, start_offset):
+        board = game.board()
+        keys = [chess.polyglot.zobrist_hash(board)]
+        for move in game.mainline_moves():
+            board.push(move); keys.append(chess.polyglot.zobrist_hash(board))
+        yield offset, game, keys
+
+def read_game_at(path: str, offset: int) -> Optional[chess.pgn.Game]:
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        f.seek(offset)
+        return chess.pgn.read_game(f)
+
+class PositionIndex:
+    """
+    On-disk Zobrist -> (PGN file, game offset, ply) index.
+    New PGN data is appended as a new sorted segment; compact() merges segments into one.
+    """
+    def __init__(self, index_dir: str, logger_func: Callable[[str, str], None] = console_logger):
+        self.index_dir: str = index_dir
+        self.logger: Callable[[str, str], None] = logger_func
+        os.makedirs(index_dir, exist_ok=True)
+        self.manifest: Dict[str, Any] = {"files": [], "segments": [], "next_segment": 0}
+        manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f: self.manifest = json.load(f)
+        self._segments: Dict[str, np.memmap] = {}
+
+    def _save_manifest(self) -> None:
+        tmp_path = os.path.join(self.index_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f: json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.index_dir, MANIFEST_NAME))
+
+    def _segment(self, name: str) -> np.ndarray:
+        if name not in self._segments:
+            path = os.path.join(self.index_dir, name)
+            if os.path.getsize(path) == 0: self._segments[name] = np.zeros(0, dtype=RECORD_DTYPE)
+            else: self._segments[name] = np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+        return self._segments[name]
+
+    def _write_segment(self, records: np.ndarray) -> str:
+        name = f"seg-{self.manifest['next_segment']:06d}.idx"
+        self.manifest["next_segment"] += 1
+        records = records[np.argsort(records["key"], kind="stable")]
+        records.tofile(os.path.join(self.index_dir, name))
+        return name
+
+    def _file_entry(self, path: str) -> Tuple[int, Dict[str, Any]]:
+        abs_path = os.path.abspath(path)
+        for file_id, entry in enumerate(self.manifest["files"]):
+            if entry["path"] == abs_path: return file_id, entry
+        self.manifest["files"].append({"path": abs_path, "indexed_bytes": 0, "games": 0})
+        return len(self.manifest["files"]) - 1, self.manifest["files"][-1]
+
+    def add_pgn(self, path: str) -> int:
+        """
+        Indexes the games of a PGN file that are not indexed yet (new files, or new games appended
+        to a file indexed before). Returns the number of games added.
+        """
+        file_id, entry = self._file_entry(path)
+        size = os.path.getsize(path)
+        if size <= entry["indexed_bytes"]: self.logger(f"{path}: up to date.", "debug"); return 0
+        start = time.time()
+        keys, plies, offsets = array("Q"), array("I"), array("Q")
+        games = 0
+        for offset, _game, game_keys in iter_pgn_positions(path, entry["indexed_bytes"]):
+            keys.extend(game_keys); plies.extend(range(len(game_keys))); offsets.extend([offset] * len(game_keys))
+            games += 1
+        if games:
+            records = np.empty(len(keys), dtype=RECORD_DTYPE)
+            records["key"] = np.frombuffer(keys, dtype=np.uint64); records["file"] = file_id
+            records["ply"] = np.frombuffer(plies, dtype=np.uint32); records["offset"] = np.frombuffer(offsets, dtype=np.uint64)
+            self.manifest["segments"].append(self._write_segment(records))
+        entry["indexed_bytes"] = size; entry["games"] += games
+        self._save_manifest()
+        self.logger(f"Indexed {games} games / {len(keys)} positions from {path} in {time.time() - start:.1f}s.", "user")
+        return games
+
+    def lookup_hash(self, key: int) -> List[Dict[str, Any]]:
+        """All (file, offset, ply) hits for a Zobrist key, one per game (first ply the position occurred)."""
+        hits: Dict[Tuple[int, int], int] = {}
+        for name in self.manifest["segments"]:
+            seg = self._segment(name)
+            lo = np.searchsorted(seg["key"], np.uint64(key), side="left")
+            hi = np.searchsorted(seg["key"], np.uint64(key), side="right")
+            for rec in seg[lo:hi]:
+                game = (int(rec["file"]), int(rec["offset"]))
+                hits[game] = min(hits.get(game, int(rec["ply"])), int(rec["ply"]))
+        return [{"path": self.manifest["files"][f]["path"], "offset": off, "ply": ply}
+                for (f, off), ply in sorted(hits.items())]
+
+    def lookup(self, board_or_fen) -> List[Dict[str, Any]]:
+        board = chess.Board(board_or_fen) if isinstance(board_or_fen, str) else board_or_fen
+        return self.lookup_hash(chess.polyglot.zobrist_hash(board))
+
+    def compact(self) -> None:
+        """Merges all segments into one sorted segment so lookups touch a single file."""
+        names = list(self.manifest["segments"])
+        if len(names) < 2: return
+        merged = np.concatenate([np.asarray(self._segment(name)) for name in names])
+        new_name = self._write_segment(merged)
+        self.manifest["segments"] = [new_name]
+        self._save_manifest()
+        self.close()
+        for name in names: os.remove(os.path.join(self.index_dir, name))
+        self.logger(f"Compacted {len(names)} segments into {new_name} ({len(merged)} records).", "user")
+
+    def close(self) -> None:
+        for seg in self._segments.values():
+            if isinstance(seg, np.memmap) and getattr(seg, "_mmap", None) is not None: seg._mmap.close()
+        self._segments = {}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zobrist position index over PGN archives.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_add = sub.add_parser("add", help="Index new PGN files / newly appended games")
+    p_add.add_argument("index_dir"); p_add.add_argument("pgn", nargs="+")
+    p_add.add_argument("--compact", action="store_true", help="Merge segments after adding")
+    p_find = sub.add_parser("lookup", help="List games that reached a position")
+    p_find.add_argument("index_dir"); p_find.add_argument("fen")
+    p_find.add_argument("--show", action="store_true", help="Print the games' headers")
+    p_compact = sub.add_parser("compact", help="Merge all segments into one")
+    p_compact.add_argument("index_dir")
+    args = parser.parse_args()
+
+    index = PositionIndex(args.index_dir)
+    if args.command == "add":
+        for pgn_path in args.pgn: index.add_pgn(pgn_path)
+        if args.compact: index.compact()
+    elif args.command == "compact": index.compact()
+    else:
+        start = time.perf_counter()
+        hits = index.lookup(args.fen)
+        console_logger(f"{len(hits)} games in {(time.perf_counter() - start) * 1000:.2f}ms", "user")
+        for hit in hits:
+            line = f"{hit['path']}@{hit['offset']} ply {hit['ply']}"
+            if args.show and (game := read_game_at(hit["path"], hit["offset"])):
+                line += f"  {game.headers.get('White', '?')} - {game.headers.get('Black', '?')} {game.headers.get('Result', '*')}"
+            console_logger(line, "user")
+    index.close()
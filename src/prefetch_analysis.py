@@ -0,0 +1,165 @@
+import argparse
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import chess
+import chess.polyglot
+
+from analysis_tree import AnalysisTree
+from chess_utils import console_logger, iter_pgn_games
+from engine_communication import ChessEngineCommunicator
+from engine_pool import EnginePool, locate_engine
+
+ALTERNATIVE_PRIORITY = 100 # alternatives queue behind every mainline ply of the same focus
+
+class Prefetcher:
+    """
+    Speculatively analyses the positions a user stepping through a game is likely to open next and
+    stores them in an AnalysisTree, so next/previous shows a depth-complete eval straight from the tree.
+    focus(boards, ply) re-targets the work: the next `ahead` plies (nearest first), then the previous
+    ply, then the positions after the engine's top `alternatives` moves at each of those plies.
+    Work for positions that left the focus is dropped and searches on them are stopped. request() runs
+    an explicit search ahead of all prefetching: it waits for a prefetch already searching the same
+    position, and otherwise stops the prefetch searches (they are re-queued) to get an engine at once.
+    """
+    def __init__(self, pool: EnginePool, tree: AnalysisTree, depth: int = 18, ahead: int = 4, alternatives: int = 2,
+                 logger: Callable[[str, str], None] = console_logger):
+        self.pool: EnginePool = pool
+        self.tree: AnalysisTree = tree
+        self.depth: int = depth
+        self.ahead: int = ahead
+        self.alternatives: int = alternatives
+        self.logger: Callable[[str, str], None] = logger
+        self.prefetched = self.cancelled = 0
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue() # (priority, seq, generation, board, expand)
+        self._seq = itertools.count()
+        self._generation = 0
+        self._wanted: Set[int] = set() # keys of the current focus; searches outside it get stopped
+        self._running: Dict[int, ChessEngineCommunicator] = {}
+        self._finished: Dict[int, threading.Event] = {} # set when the running search of a key ends
+        self._preempted: Set[int] = set() # stopped for an explicit request, to be searched again
+        self._lock = threading.Lock()
+        self._resume = threading.Event(); self._resume.set() # cleared while explicit requests run
+        self._explicit = 0
+        self._workers = [threading.Thread(target=self._work, name=f"prefetch-{i}", daemon=True) for i in range(pool.size)]
+        for worker in self._workers: worker.start()
+
+    def _put(self, priority: float, generation: int, board: Optional[chess.Board], expand: bool) -> None:
+        self._queue.put((priority, next(self._seq), generation, board, expand))
+
+    def _drain(self) -> None:
+        while True:
+            try: self._queue.get_nowait()
+            except queue.Empty: return
+
+    def focus(self, boards: List[chess.Board], ply: int) -> None:
+        """The user is at boards[ply] of a game (boards = every mainline position); re-plan the prefetch around it."""
+        targets = [(float(i), boards[ply + i]) for i in range(1, self.ahead + 1) if ply + i < len(boards)]
+        if ply > 0: targets.append((self.ahead + 0.5, boards[ply - 1]))
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._drain()
+            self._wanted = {chess.polyglot.zobrist_hash(b) for _priority, b in targets} | {chess.polyglot.zobrist_hash(boards[ply])}
+            for key, engine in self._running.items():
+                if key not in self._wanted: engine.send_command("stop"); self.cancelled += 1
+        for priority, board in targets: self._put(priority, generation, board, True)
+
+    def cancel(self) -> None:
+        """Drops all queued prefetch work and stops running prefetch searches."""
+        with self._lock:
+            self._generation += 1
+            self._drain(); self._wanted = set()
+            for engine in self._running.values(): engine.send_command("stop"); self.cancelled += 1
+
+    def request(self, board: chess.Board, depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Explicit analysis of `board`: from the tree if prefetched deep enough, else searched now ahead of prefetching."""
+        depth = depth or self.depth
+        if (node := self.tree.get(board, depth)) is not None: return {**node, "cached": True}
+        with self._lock: in_flight = self._finished.get(chess.polyglot.zobrist_hash(board)) if depth <= self.depth else None
+        if in_flight is not None: # already being prefetched: finishing that search beats starting over
+            in_flight.wait()
+            if (node := self.tree.get(board, depth)) is not None: return {**node, "cached": False}
+        with self._lock:
+            self._explicit += 1; self._resume.clear()
+            for key, engine in self._running.items(): engine.send_command("stop"); self._preempted.add(key)
+        try:
+            with self.pool.engine() as engine: res = engine.analyse(board.fen(), depth=depth, new_game=False)
+        finally:
+            with self._lock:
+                self._explicit -= 1
+                if not self._explicit: self._resume.set()
+        if res is None: return None
+        self.tree.put(board, res)
+        return {**res, "cached": False}
+
+    def _work(self) -> None:
+        while True:
+            priority, _seq, generation, board, expand = self._queue.get()
+            if board is None: return
+            self._resume.wait()
+            key = chess.polyglot.zobrist_hash(board)
+            if generation != self._generation or self.tree.get(board, self.depth) is not None: continue
+            with self.pool.engine() as engine:
+                with self._lock:
+                    if generation != self._generation or key in self._running: continue
+                    if not self._resume.is_set(): self._put(priority, generation, board, expand); continue # an explicit request got in first
+                    self._running[key] = engine; self._finished[key] = threading.Event()
+                res = engine.analyse(board.fen(), depth=self.depth, multipv=1 + self.alternatives if expand else 1, new_game=False)
+                with self._lock:
+                    del self._running[key]; self._finished.pop(key).set()
+                    preempted = key in self._preempted; self._preempted.discard(key)
+                    current = generation == self._generation
+            if res is not None and self.tree.put(board, res): self.prefetched += 1
+            if preempted and current: self._put(priority, generation, board, expand); continue
+            if res is None or not expand or not current or res["depth"] < self.depth: continue
+            for multipv in range(2, 2 + self.alternatives): # the engine's runners-up are where the user branches off
+                pv = res["lines"].get(multipv, {}).get("pv")
+                if not pv: continue
+                move = chess.Move.from_uci(pv[0])
+                if move not in board.legal_moves: continue
+                child = board.copy(); child.push(move)
+                self.tree.add_move(board, move)
+                self._put(ALTERNATIVE_PRIORITY + priority + multipv / 10, generation, child, False)
+
+    def close(self) -> None:
+        self.cancel()
+        for _ in self._workers: self._put(-1, -1, None, False)
+        for worker in self._workers: worker.join(timeout=15)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate stepping through a game with speculative prefetch and report eval latency.")
+    parser.add_argument("pgn"); parser.add_argument("--game", type=int, default=1)
+    parser.add_argument("--engine", default=None); parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--depth", type=int, default=14)
+    parser.add_argument("--dwell", type=float, default=2.0, help="Seconds spent on each ply before stepping on")
+    parser.add_argument("--ahead", type=int, default=4); parser.add_argument("--alternatives", type=int, default=2)
+    parser.add_argument("--no-prefetch", action="store_true", help="Baseline: analyse each ply only when opened")
+    args = parser.parse_args()
+
+    engine_path = args.engine or locate_engine()
+    if not engine_path: parser.error("Engine not found; pass --engine.")
+    game = next((g for i, g in enumerate(iter_pgn_games(args.pgn), 1) if i == args.game), None)
+    if game is None: parser.error(f"{args.pgn} has no game {args.game}.")
+    boards = [game.board()]
+    for move in game.mainline_moves(): board = boards[-1].copy(); board.push(move); boards.append(board)
+
+    with EnginePool(engine_path, console_logger, size=args.workers) as engine_pool:
+        prefetcher = Prefetcher(engine_pool, AnalysisTree(), args.depth, 0 if args.no_prefetch else args.ahead,
+                                0 if args.no_prefetch else args.alternatives)
+        latencies, instant = [], 0
+        for ply, board in enumerate(boards[:-1]):
+            start = time.perf_counter()
+            res = prefetcher.request(board)
+            latencies.append(time.perf_counter() - start)
+            if res and res["cached"]: instant += 1
+            prefetcher.focus(boards, ply)
+            time.sleep(max(0.0, args.dwell - latencies[-1]))
+        prefetcher.close()
+    latencies.sort()
+    console_logger(f"{len(latencies)} plies at depth {args.depth}: {instant} shown instantly from the tree, "
+                   f"median wait {latencies[len(latencies) // 2] * 1000:.0f} ms, p90 {latencies[int(len(latencies) * 0.9)] * 1000:.0f} ms, "
+                   f"{prefetcher.prefetched} prefetched, {prefetcher.cancelled} prefetch searches stopped.", "user")
@@ -0,0 +1,147 @@
+import cProfile
+import collections
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import instrumentation
+from chess_utils import console_logger
+
+SHARED_CPROFILE = sys.version_info >= (3, 12) # cProfile on sys.monitoring: one profiler sees all threads
+ENGINE_WAIT_FUNCTIONS = {"read_output_line", "_drain_until_bestmove", "_wait_ready"} # frames that mean "blocked on the engine pipe"
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all Python threads every `interval_s` and keeps them as folded stacks
+    ("thread;file:function;... count", the input format of flamegraph.pl, speedscope and inferno).
+    Samples whose stack passes through ChessEngineCommunicator's pipe reads get an "[engine-wait]" leaf,
+    so engine time and Python time separate in the graph.
+    """
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s: float = interval_s
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = self.engine_wait_samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample_once(self) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own: continue
+            parts, waiting = [], False
+            while frame is not None:
+                code = frame.f_code
+                if code.co_name in ENGINE_WAIT_FUNCTIONS: waiting = True
+                parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            parts.append(names.get(ident, f"thread-{ident}"))
+            stack = ";".join(reversed(parts)) + (";[engine-wait]" if waiting else "")
+            self.stacks[stack] += 1; self.samples += 1
+            if waiting: self.engine_wait_samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s): self._sample_once()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True); self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread: self._thread.join()
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common(): f.write(f"{stack} {n}\n")
+
+class ThreadedProfile:
+    """
+    cProfile for every thread, not just the one that enables it. Before Python 3.12 a profiler sees only
+    its own thread, so a bootstrap hook installed with threading.setprofile starts a separate
+    cProfile.Profile in each new thread on its first event; dump_stats merges them. From 3.12 cProfile
+    runs on sys.monitoring, which already sees every thread and allows one active profiler, so one is used.
+    """
+    def __init__(self):
+        self.profilers: Dict[int, cProfile.Profile] = {}
+        self._lock = threading.RLock() # re-entrant: the hook may fire again while a profiler is set up
+
+    def _bootstrap(self, frame, event, arg) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self.profilers: return
+            profiler = self.profilers[ident] = cProfile.Profile()
+        profiler.enable() # replaces this hook for the calling thread
+
+    def enable(self) -> None:
+        profiler = self.profilers[threading.get_ident()] = cProfile.Profile()
+        profiler.enable()
+        if not SHARED_CPROFILE: threading.setprofile(self._bootstrap)
+
+    def disable(self) -> None:
+        if not SHARED_CPROFILE: threading.setprofile(None)
+        with self._lock: profiler = self.profilers.get(threading.get_ident())
+        if profiler: profiler.disable()
+
+    def dump_stats(self, path: str) -> None:
+        # Threads still running keep their hook until they exit; their profile is taken as of now.
+        with self._lock: profilers = list(self.profilers.values())
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]: stats.add(profiler)
+        stats.dump_stats(path)
+
+@contextmanager
+def profile_run(name: str, mode: str = "sample", output_dir: str = "profiles", interval_s: float = 0.005,
+                logger: Callable[[str, str], None] = console_logger) -> Iterator[Dict[str, Any]]:
+    """
+    Profiles the enclosed block and writes <output_dir>/<name>-<timestamp>.{folded|pstats,summary.json}.
+    The summary splits wall time into Python CPU time (this process; engines are separate processes)
+    and time threads spent blocked on engine pipes (summed over threads, so it can exceed wall time).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.join(output_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    was_enabled = instrumentation.is_enabled()
+    instrumentation.enable()
+    wait_before = _histogram_sum("engine_pipe_wait_seconds")
+    summary: Dict[str, Any] = {"name": name, "mode": mode}
+    sampler = SamplingProfiler(interval_s) if mode == "sample" else None
+    profiler = ThreadedProfile() if mode == "cprofile" else None
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    if sampler: sampler.start()
+    if profiler: profiler.enable()
+    try: yield summary
+    finally:
+        if profiler: profiler.disable()
+        if sampler: sampler.stop()
+        summary.update({
+            "wall_s": time.perf_counter() - wall_start, "python_cpu_s": time.process_time() - cpu_start,
+            "engine_pipe_wait_s": _histogram_sum("engine_pipe_wait_seconds") - wait_before,
+        })
+        if sampler:
+            sampler.write_folded(stem + ".folded")
+            summary.update({"samples": sampler.samples, "engine_wait_samples": sampler.engine_wait_samples, "output": stem + ".folded"})
+        if profiler:
+            profiler.dump_stats(stem + ".pstats"); summary.update({"threads": "all" if SHARED_CPROFILE else len(profiler.profilers), "output": stem + ".pstats"})
+        with open(stem + ".summary.json", "w", encoding="utf-8") as f: json.dump(summary, f, indent=2)
+        if not was_enabled: instrumentation.disable()
+        logger(f"Profile: wall {summary['wall_s']:.2f}s, Python CPU {summary['python_cpu_s']:.2f}s, "
+               f"engine pipe wait {summary['engine_pipe_wait_s']:.2f}s (all threads) -> {summary['output']}", "user")
+
+def _histogram_sum(name: str) -> float:
+    hist = instrumentation.snapshot()["histograms"].get(name)
+    return hist["sum"] if hist else 0.0
+
+def add_profile_arguments(parser) -> None:
+    """Adds --profile [sample|cprofile] and --profile-dir to an entry point's argparse parser."""
+    parser.add_argument("--profile", nargs="?", const="sample", choices=("sample", "cprofile"), default=None,
+                        help="Profile this run (default sampler writes flamegraph-ready .folded stacks)")
+    parser.add_argument("--profile-dir", default="profiles")
+
+@contextmanager
+def maybe_profile(args, name: str) -> Iterator[Optional[Dict[str, Any]]]:
+    if not getattr(args, "profile", None): yield None; return
+    with profile_run(name, args.profile, args.profile_dir) as summary: yield summary
@@ -0,0 +1,192 @@
+import argparse
+import csv
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import chess
+import chess.polyglot
+
+from chess_utils import console_logger, game_fens, iter_pgn_games
+from engine_communication import ChessEngineCommunicator, score_to_cp
+from engine_pool import EnginePool, locate_engine
+from profiling import add_profile_arguments, maybe_profile
+
+# Candidate filter on the shallow pass (centipawns, side to move of the flagged position).
+SWING_CP = 200            # eval gained by the side to move through the opponent's last move
+SHALLOW_WINNING_CP = 150  # shallow evals are noisy; verification applies WINNING_CP
+ALREADY_WON_CP = 400      # position was already this good before the opponent's move: no puzzle in it
+# Verification at depth.
+WINNING_CP = 200          # the solution must keep at least this much
+ONLY_MOVE_SECOND_CP = 100 # ...and the second-best move must be worth no more than this
+MIN_PLY = 8               # skip the opening; book positions are not puzzles
+
+CSV_COLUMNS = ("id", "fen", "moves", "moves_san", "themes", "score", "mate", "depth", "source", "game", "ply")
+
+def _cp(line: Optional[Dict[str, Any]]) -> Optional[int]:
+    return score_to_cp(line["score"], line["mate"]) if line else None
+
+def is_only_winning_move(lines: Dict[int, Dict[str, Any]], winning_cp: int = WINNING_CP,
+                         second_max_cp: int = ONLY_MOVE_SECOND_CP) -> bool:
+    """True if the MultiPV-2 lines show exactly one move that wins (a mate is unique if the runner-up does not also mate)."""
+    best, second = lines.get(1), lines.get(2)
+    if best is None or (_cp(best) or 0) < winning_cp or second is None: return False
+    if best["mate"] and best["score"] > 0: return not (second["mate"] and second["score"] > 0)
+    return (_cp(second) or 0) <= second_max_cp
+
+def flag_candidates(fens: List[str], shallow: List[Optional[Dict[str, Any]]], min_ply: int = MIN_PLY) -> List[Tuple[int, List[str]]]:
+    """(ply, themes) for positions of one game that the shallow pass marks as possible puzzles."""
+    candidates = []
+    for ply in range(max(min_ply, 1), len(shallow)):
+        res, prev = shallow[ply], shallow[ply - 1]
+        if not res or 1 not in res["lines"] or chess.Board(fens[ply]).legal_moves.count() <= 1: continue
+        now = _cp(res["lines"][1])
+        themes = []
+        if prev and prev["lines"].get(1) and now is not None:
+            before = -_cp(prev["lines"][1]) # the opponent's eval before its move, seen from our side
+            if now - before >= SWING_CP and now >= SHALLOW_WINNING_CP and before < ALREADY_WON_CP: themes.append("swing")
+        if is_only_winning_move(res["lines"], SHALLOW_WINNING_CP): themes.append("only_move")
+        if themes: candidates.append((ply, themes))
+    return candidates
+
+def verify_candidate(engine: ChessEngineCommunicator, fen: str, depth: Optional[int], movetime_ms: Optional[int],
+                     max_moves: int = 3) -> Optional[Dict[str, Any]]:
+    """
+    Deep MultiPV-2 search of a candidate. Returns the puzzle with its solution line (our moves and the
+    engine's best replies) or None if no single winning move holds up. The line is extended while each
+    of our later moves is also the only winning one, and stops early at mate.
+    """
+    board = chess.Board(fen)
+    res = engine.analyse(fen, movetime_ms=movetime_ms, depth=depth, multipv=2, new_game=False)
+    if res is None or not is_only_winning_move(res["lines"]): return None
+    first = res
+    solution: List[chess.Move] = []
+    while True:
+        move = chess.Move.from_uci(res["bestmove"]) if res["bestmove"] else None
+        if move is None or move not in board.legal_moves: break
+        solution.append(move); board.push(move)
+        if board.is_game_over() or len(solution) >= 2 * max_moves - 1: break
+        pv = res["lines"][1].get("pv", [])
+        reply = chess.Move.from_uci(pv[1]) if len(pv) > 1 else None
+        if reply is None or reply not in board.legal_moves: break
+        board.push(reply)
+        res = engine.analyse(board.fen(), movetime_ms=movetime_ms, depth=depth, multipv=2, new_game=False)
+        if res is None or not is_only_winning_move(res["lines"]): board.pop(); break
+        solution.append(reply)
+    return {"fen": fen, "solution": solution, "score": first["score"], "mate": first["mate"], "depth": first["depth"]}
+
+class PuzzleWriter:
+    """Appends verified puzzles to a CSV file and/or an EPD file (bm = first move, pv = the whole solution)."""
+    def __init__(self, csv_path: Optional[str], epd_path: Optional[str]):
+        self._csv_file = open(csv_path, "w", encoding="utf-8", newline="") if csv_path else None
+        self._csv = csv.writer(self._csv_file) if self._csv_file else None
+        if self._csv: self._csv.writerow(CSV_COLUMNS)
+        self._epd_file = open(epd_path, "w", encoding="utf-8") if epd_path else None
+        self.count = 0
+
+    def write(self, puzzle: Dict[str, Any]) -> None:
+        board = chess.Board(puzzle["fen"])
+        san = []
+        for move in puzzle["solution"]: san.append(board.san(move)); board.push(move)
+        board = chess.Board(puzzle["fen"])
+        if self._csv:
+            self._csv.writerow([puzzle["id"], puzzle["fen"], " ".join(m.uci() for m in puzzle["solution"]), " ".join(san),
+                                " ".join(puzzle["themes"]), puzzle["score"], int(puzzle["mate"]), puzzle["depth"],
+                                puzzle["source"], puzzle["game"], puzzle["ply"]])
+        if self._epd_file:
+            self._epd_file.write(board.epd(bm=puzzle["solution"][0], pv=puzzle["solution"], id=puzzle["id"],
+                                           c0=" ".join(puzzle["themes"])) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        for f in (self._csv_file, self._epd_file):
+            if f: f.close()
+
+def _iter_game_positions(pgn_paths: List[str]) -> Iterator[Tuple[str, int, List[str]]]:
+    for path in pgn_paths:
+        for game_idx, game in enumerate(iter_pgn_games(path)):
+            fens, _moves = game_fens(game)
+            yield os.path.basename(path), game_idx, fens
+
+def extract_puzzles(pool: EnginePool, pgn_paths: List[str], writer: PuzzleWriter, shallow_depth: int = 8,
+                    verify_depth: Optional[int] = 18, verify_movetime_ms: Optional[int] = None, max_moves: int = 3,
+                    min_ply: int = MIN_PLY, chunk_positions: int = 2000,
+                    logger: Callable[[str, str], None] = console_logger) -> Dict[str, Any]:
+    """
+    Streams the archives in chunks of whole games: a shallow MultiPV-2 pass over every position flags
+    candidates, which are verified at depth on a background thread while the next chunk's shallow pass
+    runs, so both stages share the pool. Positions are deduplicated by Zobrist hash before verification.
+    """
+    stats = {"games": 0, "positions": 0, "candidates": 0, "puzzles": 0}
+    seen: Set[int] = set()
+    lock = threading.Lock()
+    start = time.time()
+
+    def _verify(candidates: List[Dict[str, Any]]) -> None:
+        results = pool.map(lambda engine, c: verify_candidate(engine, c["fen"], verify_depth, verify_movetime_ms, max_moves), candidates)
+        for cand, res in zip(candidates, results):
+            if res is None: continue
+            writer.write({**cand, **res})
+            with lock: stats["puzzles"] += 1
+
+    def _shallow(games: List[Tuple[str, int, List[str]]]) -> List[Dict[str, Any]]:
+        positions = [fen for _source, _game, fens in games for fen in fens]
+        shallow = pool.map(lambda engine, fen: engine.analyse(fen, depth=shallow_depth, multipv=2, new_game=False), positions)
+        candidates, offset = [], 0
+        for source, game_idx, fens in games:
+            for ply, themes in flag_candidates(fens, shallow[offset:offset + len(fens)], min_ply):
+                key = chess.polyglot.zobrist_hash(chess.Board(fens[ply]))
+                if key in seen: continue
+                seen.add(key)
+                candidates.append({"id": f"{source}:{game_idx}:{ply}", "fen": fens[ply], "themes": themes,
+                                   "source": source, "game": game_idx, "ply": ply})
+            offset += len(fens)
+        return candidates
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=1) as verifier:
+        chunk, chunk_size = [], 0
+        def _flush():
+            nonlocal chunk, chunk_size
+            candidates = _shallow(chunk)
+            stats["games"] += len(chunk); stats["positions"] += chunk_size; stats["candidates"] += len(candidates)
+            if candidates: pending.append(verifier.submit(_verify, candidates))
+            elapsed = time.time() - start
+            logger(f"{stats['games']} games, {stats['positions']} positions ({stats['positions'] / max(elapsed, 1e-9):.0f}/s), "
+                   f"{stats['candidates']} candidates, {stats['puzzles']} puzzles so far.", "user")
+            chunk, chunk_size = [], 0
+        for item in _iter_game_positions(pgn_paths):
+            chunk.append(item); chunk_size += len(item[2])
+            if chunk_size >= chunk_positions: _flush()
+        if chunk: _flush()
+        for future in pending: future.result()
+    stats["elapsed_s"] = time.time() - start
+    logger(f"Done: {stats['positions']} positions -> {stats['candidates']} candidates "
+           f"({stats['candidates'] / max(stats['positions'], 1):.1%}) -> {stats['puzzles']} puzzles in {stats['elapsed_s']:.1f}s.", "user")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract tactical puzzles from PGN archives (shallow filter, deep verification).")
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument("--csv", default="puzzles.csv"); parser.add_argument("--epd", default=None)
+    parser.add_argument("--engine", default=None); parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shallow-depth", type=int, default=8)
+    parser.add_argument("--verify-depth", type=int, default=18)
+    parser.add_argument("--verify-movetime", type=int, default=None, help="Verify by movetime (ms) instead of depth")
+    parser.add_argument("--max-moves", type=int, default=3, help="Longest solution, in moves of the solving side")
+    parser.add_argument("--min-ply", type=int, default=MIN_PLY)
+    parser.add_argument("--chunk", type=int, default=2000, help="Positions per shallow-pass chunk")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    engine_path = args.engine or locate_engine()
+    if not engine_path: parser.error("Engine not found; pass --engine.")
+    writer = PuzzleWriter(args.csv, args.epd)
+    try:
+        with maybe_profile(args, "puzzle_extractor"), EnginePool(engine_path, console_logger, size=args.workers) as engine_pool:
+            extract_puzzles(engine_pool, args.pgn, writer, args.shallow_depth,
+                            None if args.verify_movetime else args.verify_depth, args.verify_movetime,
+                            args.max_moves, args.min_ply, args.chunk)
+    finally: writer.close()
@@ -0,0 +1,166 @@
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import chess
+import chess.pgn
+
+from chess_utils import console_logger, game_fens, iter_pgn_games
+from engine_communication import score_to_cp
+from engine_pool import EnginePool, locate_engine
+from profiling import add_profile_arguments, maybe_profile
+
+# Criticality weights for the reallocation pass (all on the shallow-pass numbers).
+SWING_WEIGHT = 1.0 / 100   # per centipawn the eval moves across the ply
+UNCLEAR_WEIGHT = 2.0       # added when the top two moves are within UNCLEAR_GAP_CP
+UNCLEAR_GAP_CP = 30
+DECIDED_CP = 700           # |eval| beyond this on both sides of the ply: result no longer in doubt
+DECIDED_FACTOR = 0.2
+FEW_MOVES = 3              # positions with at most this many legal moves (recaptures, check evasions)
+FEW_MOVES_FACTOR = 0.3
+
+def _white_cp(result: Optional[Dict[str, Any]], fen: str) -> Optional[int]:
+    if result is None: return None
+    cp = score_to_cp(result["score"], result["mate"])
+    if cp is None: return None
+    return cp if chess.Board(fen).turn == chess.WHITE else -cp
+
+def criticality(fens: List[str], shallow: List[Optional[Dict[str, Any]]]) -> List[float]:
+    """
+    One weight per ply (fens[:-1]). The shallow pass also covers the final position, whose eval is the
+    "after" side of the last ply's swing, but it gets no weight and no deep search.
+    Forced moves get weight 0, everything else at least a small base so no ply is starved.
+    """
+    white_evals = [_white_cp(res, fen) for res, fen in zip(shallow, fens)]
+    weights = []
+    for ply, fen in enumerate(fens[:-1]):
+        board = chess.Board(fen)
+        legal = board.legal_moves.count()
+        if legal <= 1: weights.append(0.0); continue
+        before, after = white_evals[ply], white_evals[ply + 1] if ply + 1 < len(white_evals) else None
+        weight = 1.0
+        if before is not None and after is not None: weight += SWING_WEIGHT * min(abs(after - before), 1000)
+        lines = shallow[ply]["lines"] if shallow[ply] else {}
+        if 1 in lines and 2 in lines:
+            gap = abs((score_to_cp(lines[1]["score"], lines[1]["mate"]) or 0) - (score_to_cp(lines[2]["score"], lines[2]["mate"]) or 0))
+            if gap <= UNCLEAR_GAP_CP: weight += UNCLEAR_WEIGHT
+        if before is not None and abs(before) > DECIDED_CP and (after is None or abs(after) > DECIDED_CP): weight *= DECIDED_FACTOR
+        if legal <= FEW_MOVES: weight *= FEW_MOVES_FACTOR
+        weights.append(weight)
+    return weights
+
+def allocate(weights: List[float], total_ms: int, min_ms: int = 20, max_share: float = 0.25) -> List[int]:
+    """
+    Splits total_ms proportionally to weights; zero-weight plies get nothing, others at least min_ms
+    (less when the budget cannot cover it for every ply), none more than max_share. Never exceeds total_ms.
+    """
+    active = [i for i, w in enumerate(weights) if w > 0]
+    alloc = [0] * len(weights)
+    if not active: return alloc
+    floor = min(min_ms, total_ms // len(active)) # reserved up front so the floors never push the sum past the budget
+    cap = max(floor, int(total_ms * max_share)) - floor
+    remaining, pending = total_ms - floor * len(active), list(active)
+    # Water-filling of what is left above the floor: plies whose proportional share exceeds the cap are pinned there and the rest re-split.
+    while pending:
+        weight_sum = sum(weights[i] for i in pending)
+        share = {i: remaining * weights[i] / weight_sum for i in pending}
+        capped = [i for i in pending if share[i] > cap]
+        if not capped:
+            for i in pending: alloc[i] = floor + int(share[i])
+            break
+        for i in capped: alloc[i] = floor + cap; remaining -= cap; pending.remove(i)
+    return alloc
+
+def review_game(pool: EnginePool, game: chess.pgn.Game, budget_ms: int, shallow_depth: int = 8,
+                uniform: bool = False, logger: Callable[[str, str], None] = console_logger) -> Dict[str, Any]:
+    """
+    Two-pass review: a shallow MultiPV-2 pass over every position, then `budget_ms` of engine time
+    spread by criticality (or evenly when uniform=True) for the deep pass.
+    """
+    fens, moves = game_fens(game)
+    start = time.time()
+    shallow = pool.map(lambda engine, fen: engine.analyse(fen, depth=shallow_depth, multipv=2), fens)
+    shallow_s = time.time() - start
+    weights = criticality(fens, shallow)
+    alloc = allocate([1.0] * len(weights) if uniform else weights, budget_ms)
+    jobs = [(fens[ply], ms) for ply, ms in enumerate(alloc)]
+    start = time.time()
+    deep = pool.map(lambda engine, job: engine.analyse(job[0], movetime_ms=job[1]) if job[1] else None, jobs)
+    deep_s = time.time() - start
+    plies = []
+    for ply, fen in enumerate(fens[:-1]):
+        res = deep[ply] or shallow[ply]
+        plies.append({
+            "ply": ply, "fen": fen, "played": moves[ply].uci(), "weight": weights[ply], "movetime_ms": alloc[ply],
+            "bestmove": res["bestmove"] if res else None, "score": res["score"] if res else None,
+            "mate": res["mate"] if res else False, "depth": res["depth"] if res else 0,
+        })
+    logger(f"Reviewed {len(plies)} plies: shallow pass {shallow_s:.1f}s, deep pass {deep_s:.1f}s "
+           f"({'uniform' if uniform else 'scheduled'}, {budget_ms}ms budget).", "debug")
+    return {"plies": plies, "shallow_s": shallow_s, "deep_s": deep_s, "engine_ms": sum(alloc)}
+
+def compare_to_reference(review: Dict[str, Any], reference: Dict[str, Any]) -> Dict[str, float]:
+    """Best-move agreement and mean |eval error| (cp, clipped at 1000) of a review against a long reference analysis."""
+    agree, errors = 0, []
+    for ply, ref in zip(review["plies"], reference["plies"]):
+        if ply["bestmove"] == ref["bestmove"]: agree += 1
+        a, b = score_to_cp(ply["score"], ply["mate"]), score_to_cp(ref["score"], ref["mate"])
+        if a is not None and b is not None: errors.append(min(abs(a - b), 1000))
+    n = max(len(reference["plies"]), 1)
+    return {"agreement": agree / n, "mean_eval_error": sum(errors) / len(errors) if errors else 0.0}
+
+def benchmark(pool: EnginePool, games: List[chess.pgn.Game], budget_per_ply_ms: int, reference_ms: int,
+              shallow_depth: int = 8, logger: Callable[[str, str], None] = console_logger) -> Dict[str, Any]:
+    """Scheduled vs uniform allocation at the same total budget, both scored against a reference of reference_ms per ply."""
+    totals = {"uniform": [], "scheduled": []}
+    for index, game in enumerate(games):
+        plies = len(list(game.mainline_moves()))
+        if not plies: continue
+        budget = budget_per_ply_ms * plies
+        reference = review_game(pool, game, reference_ms * plies, shallow_depth, uniform=True, logger=logger)
+        for mode in totals:
+            review = review_game(pool, game, budget, shallow_depth, uniform=(mode == "uniform"), logger=logger)
+            quality = compare_to_reference(review, reference)
+            totals[mode].append({**quality, "time_s": review["shallow_s"] + review["deep_s"]})
+            logger(f"game {index + 1} {mode:>9}: agreement {quality['agreement']:.1%}, eval error {quality['mean_eval_error']:.0f}cp, "
+                   f"{totals[mode][-1]['time_s']:.1f}s", "user")
+    summary = {}
+    for mode, rows in totals.items():
+        if not rows: continue
+        summary[mode] = {key: sum(r[key] for r in rows) / len(rows) for key in ("agreement", "mean_eval_error", "time_s")}
+        logger(f"{mode:>9}: mean agreement {summary[mode]['agreement']:.1%}, mean eval error {summary[mode]['mean_eval_error']:.0f}cp, "
+               f"mean wall {summary[mode]['time_s']:.1f}s/game", "user")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Criticality-scheduled whole-game review.")
+    parser.add_argument("command", choices=("review", "bench"))
+    parser.add_argument("pgn")
+    parser.add_argument("--engine", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--budget", type=int, default=None, help="Total deep-pass engine ms per game (review; default 300ms x plies)")
+    parser.add_argument("--budget-per-ply", type=int, default=300, help="Average ms per ply (bench)")
+    parser.add_argument("--reference-ms", type=int, default=3000, help="Per-ply movetime of the reference analysis (bench)")
+    parser.add_argument("--shallow-depth", type=int, default=8)
+    parser.add_argument("--games", type=int, default=5, help="Games to use from the PGN (bench)")
+    parser.add_argument("--uniform", action="store_true", help="Spread the budget evenly instead (review)")
+    parser.add_argument("--json", default=None)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    engine_path = args.engine or locate_engine()
+    if not engine_path: parser.error("Engine not found; pass --engine.")
+    with maybe_profile(args, f"review_scheduler-{args.command}"), EnginePool(engine_path, console_logger, size=args.workers) as engine_pool:
+        if args.command == "review":
+            game = next(iter_pgn_games(args.pgn))
+            budget = args.budget or args.budget_per_ply * len(list(game.mainline_moves()))
+            output = review_game(engine_pool, game, budget, args.shallow_depth, uniform=args.uniform)
+            for p in output["plies"]:
+                console_logger(f"{p['ply']:>3} {p['played']:<6} best {p['bestmove'] or '-':<6} score {p['score']}{'#' if p['mate'] else ''} "
+                               f"depth {p['depth']:>2} time {p['movetime_ms']}ms", "user")
+        else:
+            games = [g for _, g in zip(range(args.games), iter_pgn_games(args.pgn))]
+            output = benchmark(engine_pool, games, args.budget_per_ply, args.reference_ms, args.shallow_depth)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(output, f, indent=2)
@@ -11,7 +11,7 @@ import numpy as np
 
 from config import (
     CHESS_USERNAME, CHESS_PASSWORD, DEFAULT_ENGINE_NAME,
-    WINDOW_TITLE, DEFAULT_WINDOW_SIZE, DEBUG_WINDOW_SIZE,
+    WINDOW_TITLE, DEFAULT_WINDOW_SIZE, DEBUG_WINDOW_SIZE, BOARD_VIEW_SIZE,
     ENGINE_PATH_LOCAL, ENGINE_PATH_LOCAL_EXE, BASE_DIR,
     FAILSAFE_KEY,
     SCREEN_WIDTH, SCREEN_HEIGHT, PERLIN_RES_SCALE, PERLIN_NOISE_SCALE,
@@ -20,10 +20,12 @@ from config import (
 )
 from browser_automation import BrowserManager
 from engine_communication import ChessEngineCommunicator # Changed
+from board_view import BoardView
 from auto_player import AutoPlayer
 from keyboard_listener import KeyboardListener
 from perlin_noise_helpers import Perlin
 import input_automation
+import instrumentation
 
 
 class ChessApp(ctk.CTk):
@@ -105,9 +107,13 @@ class ChessApp(ctk.CTk):
         self.btn_clear_chat = ctk.CTkButton(button_frame, text="Clear Output", command=self._clear_output_command_handler)
         self.btn_clear_chat.pack(pady=5, padx=5, fill="x")
         
-        output_frame = ctk.CTkFrame(self.main_frame)
-        output_frame.pack(pady=5, padx=5, fill="both", expand=True)
-        self.output_textbox = ctk.CTkTextbox(output_frame, wrap="word", state="disabled", height=150)
+        self.board_view_frame = ctk.CTkFrame(self.main_frame) # packed on first "Get Virtual Board"
+        self.board_view: Optional[BoardView] = None
+        self.board_view_visible: bool = False
+
+        self.output_frame = ctk.CTkFrame(self.main_frame)
+        self.output_frame.pack(pady=5, padx=5, fill="both", expand=True)
+        self.output_textbox = ctk.CTkTextbox(self.output_frame, wrap="word", state="disabled", height=150)
         self.output_textbox.pack(fill="both", expand=True, padx=5, pady=5)
 
         self.btn_toggle_debug_logs = ctk.CTkButton(self.main_frame, text="Show Debug Logs", command=self._toggle_debug_logs_command_handler, height=28)
@@ -123,12 +129,16 @@ class ChessApp(ctk.CTk):
         if self.debug_logs_visible:
             self.debug_log_textbox_frame.pack_forget()
             self.btn_toggle_debug_logs.configure(text="Show Debug Logs")
-            self.geometry(DEFAULT_WINDOW_SIZE)
         else:
             self.debug_log_textbox_frame.pack(pady=5, padx=5, fill="both", expand=True, before=self.btn_toggle_debug_logs)
             self.btn_toggle_debug_logs.configure(text="Hide Debug Logs")
-            self.geometry(DEBUG_WINDOW_SIZE)
         self.debug_logs_visible = not self.debug_logs_visible
+        self._apply_window_size()
+
+    def _apply_window_size(self) -> None:
+        width, height = map(int, (DEBUG_WINDOW_SIZE if self.debug_logs_visible else DEFAULT_WINDOW_SIZE).split("x"))
+        if self.board_view_visible: height += BOARD_VIEW_SIZE + 20
+        self.geometry(f"{width}x{height}")
 
     def add_to_output(self, message: str, log_type: str = "user") -> None:
         if self.output_textbox is None or self.debug_log_textbox is None:
@@ -189,6 +199,9 @@ class ChessApp(ctk.CTk):
         if not self.browser_manager.login(CHESS_USERNAME, CHESS_PASSWORD): messagebox.showwarning("Login Failed", "Login failed.")
 
     def _update_internal_board_state(self) -> bool:
+        with instrumentation.span("board_reconstruction"): return self._rebuild_internal_board()
+
+    def _rebuild_internal_board(self) -> bool:
         self.internal_board.reset()
         scraped_moves = self.browser_manager.get_scraped_moves()
         if not scraped_moves: self.add_to_output("No moves scraped. Board reset.", "debug"); return True
@@ -205,9 +218,23 @@ class ChessApp(ctk.CTk):
     def _get_board_command_handler(self) -> None:
         if self._update_internal_board_state():
             if not self.internal_board.move_stack: self.add_to_output("Board is initial.", "user")
-            self.add_to_output("--- Virtual Board ---\n" + str(self.internal_board) + "\n-------------------", "user")
+            if not self._show_board_view(self.internal_board):
+                self.add_to_output("--- Virtual Board ---\n" + str(self.internal_board) + "\n-------------------", "user")
         else: self.add_to_output("Could not display board (parse failed).", "user")
 
+    def _show_board_view(self, board: chess.Board) -> bool:
+        """Draws the board in the board view (created on first use); False if it cannot be shown, e.g. missing assets."""
+        if self.board_view is None:
+            try: self.board_view = BoardView(self.board_view_frame, os.path.join(BASE_DIR, "assets"), size=BOARD_VIEW_SIZE)
+            except Exception as e: self.add_to_output(f"Board view unavailable, using text board: {e}", "debug"); return False
+            self.board_view.pack(padx=5, pady=5)
+        if not self.board_view_visible:
+            self.board_view_frame.pack(pady=5, padx=5, before=self.output_frame)
+            self.board_view_visible = True; self._apply_window_size()
+        redrawn = self.board_view.show(board)
+        self.add_to_output(f"Board view updated ({redrawn} squares redrawn). FEN: {board.fen()}", "debug")
+        return True
+
     def _get_fen_command_handler(self) -> None:
         if self._update_internal_board_state():
             if not self.internal_board.move_stack: self.add_to_output("Board is initial.", "user")